@@ -148,8 +148,6 @@ CREATE TABLE IF NOT EXISTS public.gaiadr2_source (
 )
 PARTITION BY LIST (region_id);
 
-CREATE INDEX source_id_idx ON public.gaiadr2_source (source_id);
-
 COMMENT ON TABLE public.gaiadr2_source IS 'Table that replicates Gaia DR2 data. More info at: https://gea.esac.esa.int/archive/documentation/GDR2/Gaia_archive/chap_datamodel/sec_dm_main_tables/ssec_dm_gaia_source.html';
 
 COMMENT ON COLUMN public.gaiadr2_source.region_id IS 'ID of the container region';
@@ -341,3 +339,6 @@ COMMENT ON COLUMN public.gaiadr2_source.lum_val IS 'Stellar luminosity (Luminosi
 COMMENT ON COLUMN public.gaiadr2_source.lum_percentile_lower IS 'lum_val lower uncertainty (Luminosity[Solar Luminosity])';
 
 COMMENT ON COLUMN public.gaiadr2_source.lum_percentile_upper IS 'lum_val upper uncertainty (Luminosity[Solar Luminosity])';
+
+-- Spatial index used to select stars by position (see DB.get_stars with use_region_id=False)
+CREATE INDEX IF NOT EXISTS gaiadr2_source_position_idx ON public.gaiadr2_source USING gist (point(ra, dec));
@@ -1 +1 @@
-from .openclust import Catalogue, OpenClust
+from .openclust import Catalogue, OpenClust, OpenClustCatalogue
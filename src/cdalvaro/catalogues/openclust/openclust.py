@@ -1,8 +1,10 @@
 import astropy.units as u
 from astropy.coordinates import SkyCoord
+import numpy as np
 import os
 import pandas
-from typing import Dict, Set, TypeVar, Union
+import pickle
+from typing import Dict, Iterable, Iterator, Mapping, Set, TypeVar, Union
 
 from ..base_catalogue import BaseCatalogue
 from ...logging import Logger
@@ -10,6 +12,113 @@ from ...models import OpenCluster
 
 Catalogue = TypeVar('Catalogue', bound=Dict[str, OpenCluster])
 
+# clusters.dat fields (0-based, end exclusive) as described inside ReadMe.txt
+COLSPECS = [(0, 17), (18, 20), (21, 23), (24, 26), (27, 30), (31, 33), (34, 36), (37, 39), (41, 47), (93, 98),
+            (144, 152)]
+NAMES = [
+    'name', 'ra_hours', 'ra_minutes', 'ra_seconds', 'dec_deg', 'dec_arcmin', 'dec_arcsec', 'g1_class', 'diam',
+    'number_of_cluster_members', 'trumpler'
+]
+NUMERIC_NAMES = ['ra_hours', 'ra_minutes', 'ra_seconds', 'dec_deg', 'dec_arcmin', 'dec_arcsec', 'diam']
+
+
+class OpenClustCatalogue(Mapping):
+    """
+    Read-only mapping with the OpenClust clusters indexed by name.
+
+    Clusters are stored as parallel arrays (one per field), so catalogue-wide
+    operations can work directly with NumPy. OpenCluster objects are only
+    built the first time each cluster is requested.
+
+    Args:
+        names (Iterable[str]): The name of the clusters.
+        ra (Iterable[float]): The right ascension of the clusters in degrees.
+        dec (Iterable[float]): The declination of the clusters in degrees.
+        diam (Iterable[float]): The diameter of the clusters in arcmin.
+        trumpler (Iterable[str]): Trumpler type of the clusters.
+        g1_class (Iterable[str]): Flag for classification of the clusters (G1).
+        number_of_cluster_members (Iterable[int]): Estimated number of members of the clusters.
+    """
+    def __init__(self, names: Iterable[str], ra: Iterable[float], dec: Iterable[float], diam: Iterable[float],
+                 trumpler: Iterable[str], g1_class: Iterable[str], number_of_cluster_members: Iterable[int]):
+        self.names = np.asarray(names, dtype=object)
+        self.ra = np.asarray(ra, dtype=np.float64)
+        self.dec = np.asarray(dec, dtype=np.float64)
+        self.diam = np.asarray(diam, dtype=np.float64)
+        self.trumpler = np.asarray(trumpler, dtype=object)
+        self.g1_class = np.asarray(g1_class, dtype=object)
+        self.number_of_cluster_members = np.asarray(number_of_cluster_members, dtype=object)
+
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._clusters = dict()
+
+    def __getitem__(self, name: str) -> OpenCluster:
+        if name not in self._clusters:
+            i = self._index[name]
+            self._clusters[name] = OpenCluster(name=self.names[i],
+                                               coords=SkyCoord(ra=self.ra[i] * u.degree,
+                                                               dec=self.dec[i] * u.degree,
+                                                               frame="icrs"),
+                                               diam=u.Quantity(self.diam[i], u.arcmin),
+                                               trumpler=self.trumpler[i],
+                                               g1_class=self.g1_class[i],
+                                               number_of_cluster_members=self.number_of_cluster_members[i])
+        return self._clusters[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_clusters'] = dict()
+        return state
+
+    def subset(self, names: Iterable[str]) -> 'OpenClustCatalogue':
+        """
+        Get a new catalogue with the clusters matching the given names.
+
+        Names not available in the catalogue are ignored.
+
+        Args:
+            names (Iterable[str]): The name of the clusters to be selected.
+
+        Returns:
+            OpenClustCatalogue: A catalogue with the selected clusters.
+        """
+        indices = [index for index in map(self._index.get, names) if index is not None]
+        return OpenClustCatalogue(names=self.names[indices],
+                                  ra=self.ra[indices],
+                                  dec=self.dec[indices],
+                                  diam=self.diam[indices],
+                                  trumpler=self.trumpler[indices],
+                                  g1_class=self.g1_class[indices],
+                                  number_of_cluster_members=self.number_of_cluster_members[indices])
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        """
+        Convert the catalogue into a Pandas DataFrame indexed by the clusters name.
+
+        Returns:
+            pandas.DataFrame: The catalogue as a DataFrame.
+        """
+        return pandas.DataFrame(
+            {
+                'name': self.names,
+                'ra': self.ra,
+                'dec': self.dec,
+                'diam': u.Quantity(self.diam, u.arcmin).to_value(u.degree),
+                'trumpler': self.trumpler,
+                'g1_class': self.g1_class,
+                'number_of_cluster_members': self.number_of_cluster_members.astype(np.float64)
+            },
+            index=pandas.Index(self.names))
+
 
 class OpenClust(BaseCatalogue):
     """
@@ -19,7 +128,8 @@ class OpenClust(BaseCatalogue):
     """
 
     _catalogue_file = os.path.join(os.path.dirname(__file__), "clusters.dat")
-    _catalogue = dict()
+    _cache_file = f"{_catalogue_file}.pkl"
+    _catalogue: OpenClustCatalogue = None
     _logger = Logger.instance()
 
     @staticmethod
@@ -50,11 +160,7 @@ class OpenClust(BaseCatalogue):
         Returns:
             Catalogue: A catalogue with the found clusters.
         """
-        selection = dict()
-        whole_catalogue = OpenClust._load_catalogue()
-        for name in names:
-            if name in whole_catalogue.keys():
-                selection[name] = whole_catalogue[name]
+        selection = OpenClust._load_catalogue().subset(names)
 
         if as_dataframe:
             return OpenClust._catalogue_to_dataframe(selection)
@@ -69,90 +175,134 @@ class OpenClust(BaseCatalogue):
         Returns:
             Catalogue: The whole OpenClust catalogue.
         """
-        if len(OpenClust._catalogue.keys()) > 0:
+        if OpenClust._catalogue is not None:
+            return OpenClust._catalogue
+
+        cached_catalogue = OpenClust._load_cached_catalogue()
+        if cached_catalogue is not None:
+            OpenClust._catalogue = cached_catalogue
             return OpenClust._catalogue
 
         OpenClust._logger.debug("Loading OpenClust catalogue ...")
 
-        with open(OpenClust._catalogue_file, 'r') as f:
-            for line in f.readlines():
-                try:
-                    cluster = OpenClust._parse_catalogue_entry(line.rstrip())
-                    OpenClust._catalogue[cluster.name] = cluster
-                except ValueError as ex:
-                    OpenClust._logger.warn(ex)
+        entries = pandas.read_fwf(OpenClust._catalogue_file,
+                                  colspecs=COLSPECS,
+                                  names=NAMES,
+                                  dtype=str,
+                                  keep_default_na=False,
+                                  header=None).fillna('')
+
+        OpenClust._catalogue = OpenClust._parse_catalogue_entries(entries)
 
         OpenClust._logger.debug("OpenClust catalogue loaded!")
 
+        OpenClust._save_cached_catalogue(OpenClust._catalogue)
+
         return OpenClust._catalogue
 
     @staticmethod
-    def _parse_catalogue_entry(entry: str) -> OpenCluster:
+    def _load_cached_catalogue() -> Union[OpenClustCatalogue, None]:
         """
-        Method for parsing each entry of the catalogue.
+        Load the parsed catalogue from the cache file.
+
+        The cache is only used when it is newer than clusters.dat.
+
+        Returns:
+            Union[OpenClustCatalogue, None]: The cached catalogue, or None if it is not available.
+        """
+        try:
+            if os.path.getmtime(OpenClust._cache_file) < os.path.getmtime(OpenClust._catalogue_file):
+                return None
+
+            with open(OpenClust._cache_file, 'rb') as f:
+                catalogue = pickle.load(f)
+
+            if not isinstance(catalogue, OpenClustCatalogue):
+                raise TypeError(f"unexpected cached type {type(catalogue).__name__}")
+        except Exception as error:
+            OpenClust._logger.debug(f"OpenClust catalogue cache is not available. Cause: {error}")
+            return None
+
+        OpenClust._logger.debug("OpenClust catalogue loaded from cache!")
+
+        return catalogue
+
+    @staticmethod
+    def _save_cached_catalogue(catalogue: OpenClustCatalogue):
+        """
+        Save the parsed catalogue into the cache file.
+
+        Args:
+            catalogue (OpenClustCatalogue): The catalogue to be cached.
+        """
+        try:
+            with open(OpenClust._cache_file, 'wb') as f:
+                pickle.dump(catalogue, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as error:
+            OpenClust._logger.warn(f"Unable to save OpenClust catalogue cache. Cause: {error}")
+
+    @staticmethod
+    def _parse_catalogue_entries(entries: pandas.DataFrame) -> OpenClustCatalogue:
+        """
+        Method for parsing the entries of the catalogue.
 
         Information about the content of clusters.dat file
         is available inside ReadMe.txt
 
+        Invalid entries are discarded with a warning. Coordinates and diameters
+        of the valid ones are converted in a single batch, and clusters are
+        not built until they are requested from the catalogue.
+
         Args:
-            entry (str): Each row of the clusters.dat file
+            entries (pandas.DataFrame): The clusters.dat file split into the `NAMES` columns
 
         Returns:
-            OpenCluster: An OpenCluster object with the cluster information
-        """
-
-        # Cluster name
-        name = entry[0:17].strip()
-        if len(name) == 0:
-            raise ValueError("Cluster unable to create a cluster without name")
-
-        # Right Ascension
-        ra_hours = entry[18:20]
-        ra_minutes = entry[21:23]
-        ra_seconds = entry[24:26]
-        ra = f"{ra_hours}:{ra_minutes}:{ra_seconds}"
-        if len(ra) != 8:
-            raise ValueError(f"Cluster {name} does not have a valid right ascension: '{ra}'")
-
-        # Declination
-        dec_deg = entry[27:30]
-        dec_arcmin = entry[31:33]
-        dec_arcsec = entry[34:36]
-        dec = f"{dec_deg}:{dec_arcmin}:{dec_arcsec}"
-        if len(dec) != 9:
-            raise ValueError(f"Cluster {name} does not have a valid declination: '{dec}'")
-
-        coords = SkyCoord(f"{ra} {dec}", unit=(u.hourangle, u.degree), frame="icrs")
-
-        # G1 class
-        g1_class = entry[37:39].strip()
-        if len(g1_class) == 0:
-            g1_class = None
-
-        # Diameter
-        diam = entry[41:47].strip()
-        if len(diam) == 0:
-            raise ValueError(f"Cluster '{name}' does not have diameter info")
-        diam = u.Quantity(diam, u.arcmin)
-
-        # Number of cluster members
-        n_cluster_members = entry[93:98].strip()
-        if len(n_cluster_members) == 0:
-            n_cluster_members = None
-        else:
-            n_cluster_members = int(n_cluster_members)
-
-        # Trumpler
-        trumpler = entry[144:152].strip()
-
-        OpenClust._logger.debug(f"Loaded cluster: {name}")
-
-        return OpenCluster(name=name,
-                           coords=coords,
-                           diam=diam,
-                           trumpler=trumpler,
-                           g1_class=g1_class,
-                           number_of_cluster_members=n_cluster_members)
+            OpenClustCatalogue: The catalogue with the clusters information
+        """
+        ra = entries['ra_hours'] + ':' + entries['ra_minutes'] + ':' + entries['ra_seconds']
+        dec = entries['dec_deg'] + ':' + entries['dec_arcmin'] + ':' + entries['dec_arcsec']
+
+        has_name = entries['name'].str.len() > 0
+        has_ra = ra.str.len() == 8
+        has_dec = dec.str.len() == 9
+        has_diam = entries['diam'].str.len() > 0
+        valid = has_name & has_ra & has_dec & has_diam
+
+        for index in entries.index[~valid]:
+            name = entries.at[index, 'name']
+            if not has_name[index]:
+                OpenClust._logger.warn("Cluster unable to create a cluster without name")
+            elif not has_ra[index]:
+                OpenClust._logger.warn(f"Cluster {name} does not have a valid right ascension: '{ra[index]}'")
+            elif not has_dec[index]:
+                OpenClust._logger.warn(f"Cluster {name} does not have a valid declination: '{dec[index]}'")
+            else:
+                OpenClust._logger.warn(f"Cluster '{name}' does not have diameter info")
+
+        entries = entries[valid].drop_duplicates(subset='name', keep='last')
+
+        # Sexagesimal fields are converted to degrees with plain array arithmetic,
+        # so astropy does not need to parse any coordinate string.
+        numeric_fields = entries[NUMERIC_NAMES].to_numpy(dtype=np.float64).T
+        ra_hours, ra_minutes, ra_seconds, dec_deg, dec_arcmin, dec_arcsec, diam = numeric_fields
+        dec_sign = np.where(entries['dec_deg'].str.startswith('-').to_numpy(), -1.0, 1.0)
+
+        ra_deg = 15.0 * (ra_hours + ra_minutes / 60.0 + ra_seconds / 3600.0)
+        dec_deg = dec_sign * (np.abs(dec_deg) + dec_arcmin / 60.0 + dec_arcsec / 3600.0)
+
+        g1_class = entries['g1_class'].where(entries['g1_class'].str.len() > 0, None)
+        number_of_cluster_members = [
+            int(n_cluster_members) if len(n_cluster_members) > 0 else None
+            for n_cluster_members in entries['number_of_cluster_members']
+        ]
+
+        return OpenClustCatalogue(names=entries['name'].to_numpy(),
+                                  ra=ra_deg,
+                                  dec=dec_deg,
+                                  diam=diam,
+                                  trumpler=entries['trumpler'].to_numpy(),
+                                  g1_class=g1_class.to_numpy(),
+                                  number_of_cluster_members=number_of_cluster_members)
 
     @staticmethod
     def _catalogue_to_dataframe(catalogue: Catalogue) -> pandas.DataFrame:
@@ -165,6 +315,9 @@ class OpenClust(BaseCatalogue):
         Returns:
             pandas.DataFrame: The catalogue as a DataFrame.
         """
+        if isinstance(catalogue, OpenClustCatalogue):
+            return catalogue.to_dataframe()
+
         data = dict()
         for cluster in catalogue.values():
             data[cluster.name] = dict(cluster)
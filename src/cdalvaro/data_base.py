@@ -1,11 +1,17 @@
 from astropy.coordinates import SkyCoord
+from astropy.table import Column, Table
 import astropy.units as u
+from contextlib import contextmanager
+import functools
+import io
+import logging
 import numpy as np
 import os
 import pandas as pd
-from sqlalchemy import create_engine, MetaData, select, any_
-from sqlalchemy.dialects.postgresql import insert
-from typing import Dict, List, Set, TypeVar, Union
+from sqlalchemy import create_engine, MetaData
+from sqlalchemy import types as sqltypes
+import threading
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Set, Tuple, TypeVar, Union
 
 from .catalogues.base_catalogue import Catalogue
 from .logging import Logger
@@ -15,6 +21,11 @@ from .models.region import Region
 Regions = TypeVar('Regions', bound=Set[Region])
 SourceID = TypeVar('SourceID', bound=int)
 
+# Columns recovered by DB.get_stars when no columns are specified
+DEFAULT_STAR_COLUMNS = ('ra', 'ra_error', 'dec', 'dec_error', 'parallax', 'parallax_error', 'pmra', 'pmra_error',
+                        'pmdec', 'pmdec_error', 'phot_g_mean_mag', 'phot_bp_mean_mag', 'phot_rp_mean_mag', 'bp_rp',
+                        'radial_velocity')
+
 
 class DB:
     """
@@ -27,6 +38,11 @@ class DB:
 
     _logger: Logger = Logger.instance()
     _instance = dict()
+    _instance_lock = threading.Lock()
+    _pool_size = int(os.getenv('DB_POOL_SIZE', 4))
+    _pool_max_overflow = int(os.getenv('DB_POOL_MAX_OVERFLOW', 12))
+    _pool_recycle = int(os.getenv('DB_POOL_RECYCLE', 3600))
+    _copy_batch_size = int(os.getenv('DB_COPY_BATCH_SIZE', 100_000))
 
     def __init__(self, host: str, port: int):
         db_settings = {
@@ -40,10 +56,26 @@ class DB:
         conn_str = "{}://{}:{}@{}:{}/{}".format("postgresql+psycopg2", db_settings["user"], db_settings["password"],
                                                 db_settings["host"], db_settings["port"], db_settings["dbname"])
 
-        self.engine = create_engine(conn_str, pool_recycle=3600, execution_options={'autocommit': True})
+        # Every operation checks out its own connection from the engine pool,
+        # so a single DB instance can be shared between threads.
+        # Pooled connections keep their prepared statements and staging table until they are recycled,
+        # and writes are committed explicitly, so read-only queries are never committed.
+        # executemany calls are sent with psycopg2 execute_values/execute_batch instead of one statement per row.
+        self.engine = create_engine(conn_str,
+                                    pool_size=DB._pool_size,
+                                    max_overflow=DB._pool_max_overflow,
+                                    pool_recycle=DB._pool_recycle,
+                                    pool_pre_ping=False,
+                                    executemany_mode='values_plus_batch',
+                                    executemany_values_page_size=1000,
+                                    executemany_batch_page_size=500)
         self.metadata = MetaData(self.engine)
         self.metadata.reflect()
 
+        # Region ids never change once a region is saved, so they are only requested once
+        self._regions_id: Dict[str, int] = dict()
+        self._stars_columns_cache: Dict[Tuple[str, ...], str] = dict()
+
     @staticmethod
     def instance(host: str, port: int) -> 'DB':
         """
@@ -57,8 +89,9 @@ class DB:
             DB: A cdalvaro DB instance pointing to host:port
         """
         key = f"{host}:{port}"
-        if key not in DB._instance:
-            DB._instance[key] = DB(host=host, port=port)
+        with DB._instance_lock:
+            if key not in DB._instance:
+                DB._instance[key] = DB(host=host, port=port)
 
         return DB._instance[key]
 
@@ -67,6 +100,8 @@ class DB:
         Returns a dictionary where the keys are the regions name,
         and values are the ids of the corresponding region.
 
+        Ids are cached, so only regions not seen before are requested to the database.
+
         Args:
             regions (Regions): A set with regions whose ids are going to be recovered.
             update_regions (bool, optional): If True, regions set is updated with their corresponding id. Defaults to True.
@@ -74,65 +109,204 @@ class DB:
         Returns:
             Dict[str, int]: A dictionary relating region names with their corresponding ids.
         """
-        regions_name = list(map(lambda x: x.name, regions))
-        DB._logger.debug(f"Getting regions id for regions: {', '.join(regions_name)} from DB ...")
+        regions_name = sorted(region.name for region in regions)
+        missing_names = [name for name in regions_name if name not in self._regions_id]
+
+        if len(missing_names) > 0:
+            if DB._logger.isEnabledFor(logging.DEBUG):
+                DB._logger.debug(f"Getting regions id for regions: {', '.join(missing_names)} from DB ...")
+
+            try:
+                with self.engine.connect() as connection:
+                    result = DB._execute_prepared(connection,
+                                                  name='get_regions_id',
+                                                  statement="""
+                                                      SELECT name, id FROM public.regions
+                                                      WHERE name = ANY($1::text[])
+                                                      """,
+                                                  params=(missing_names, )).fetchall()
+            except Exception as error:
+                DB._logger.error(f"An error ocurred recovering regions id from DB. Cause: {error}")
+                raise error
+
+            self._regions_id.update(result)
+
+        regions_id = {name: self._regions_id[name] for name in regions_name if name in self._regions_id}
+
+        if update_regions:
+            for region in regions:
+                if region.name in regions_id:
+                    region.serial = regions_id[region.name]
+
+        return regions_id
+
+    def get_stars_source_id(self, regions: Regions, as_array: bool = False) -> Union[Set[SourceID], np.ndarray]:
+        """
+        Get a set of source_id's of the stars available in the database
+        contained inside the given regions.
+
+        The source_id's are sent by the database with a binary COPY and decoded
+        with NumPy in a single pass, so no Python object is created per row.
+
+        Args:
+            regions (Regions): The regions that contains the stars of interest.
+            as_array (bool, optional): Flag to recover source_id's as a sorted NumPy array instead of a set,
+                so no Python object is created per star. Defaults to False.
+
+        Returns:
+            Union[Set[SourceID], np.ndarray]: The source_id of every star inside the given regions.
+        """
+        if DB._logger.isEnabledFor(logging.DEBUG):
+            regions_name = [region.name for region in regions]
+            DB._logger.debug(f"Getting the stars's source_id for regions: {', '.join(regions_name)} from DB ...")
 
         try:
-            regions_t = self.metadata.tables['regions']
-            select_stmt = select([regions_t.c.name, regions_t.c.id
-                                  ]).where(regions_t.c.name == any_(regions_name)).order_by(regions_t.c.name)
+            # Region ids are resolved beforehand (and cached) instead of joining public.regions,
+            # so the planner can prune the gaiadr2_source partitions of other regions.
+            region_ids = list(self.get_regions_id(regions=regions).values())
 
-            with self.engine.connect() as connection:
-                result = connection.execute(select_stmt).fetchall()
+            buffer = io.BytesIO()
+            with self._cursor() as cursor:
+                query = cursor.mogrify("SELECT source_id FROM public.gaiadr2_source WHERE region_id = ANY(%s)",
+                                       (region_ids, )).decode(cursor.connection.encoding)
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
         except Exception as error:
-            DB._logger.error(f"An error ocurred recovering regions id from DB. Cause: {error}")
+            DB._logger.error(f"An error ocurred recovering stars source_id from DB. Cause: {error}")
             raise error
 
-        regions_id = dict()
-        for (name, serial) in result:
-            regions_id[name] = serial
-            if update_regions and name in regions:
-                region, *_ = filter(lambda x: x.name == name, regions)
-                region.serial = serial
+        source_ids, = DB._binary_copy_columns(buffer.getbuffer(), dtypes=['>i8'])
+        if as_array:
+            return np.sort(source_ids)
 
-        return regions_id
+        return set(source_ids.tolist())
 
-    def get_stars_source_id(self, regions: Regions) -> List[str]:
+    def get_stars_source_ids(self,
+                             regions: Regions,
+                             as_array: bool = False) -> Dict[str, Union[Set[SourceID], np.ndarray]]:
         """
-        Get a list of source_id's of the stars available in the database
-        contained inside the given regions.
+        Get the source_id's of the stars available in the database for each one of the given regions.
+
+        Every region is fetched with a single binary COPY, so many regions cost one round trip.
 
         Args:
             regions (Regions): The regions that contains the stars of interest.
+            as_array (bool, optional): Flag to recover the source_id's of each region as a sorted NumPy array
+                instead of a set, so no Python object is created per star. Defaults to False.
 
         Returns:
-            List[str]: A list with the source_id of every star inside the given regions.
+            Dict[str, Union[Set[SourceID], np.ndarray]]: A dictionary relating region names
+                with the source_id of their stars.
         """
-        regions_name = list(map(lambda x: x.name, regions))
-        DB._logger.debug(f"Getting the stars's source_id for regions: {', '.join(regions_name)} from DB ...")
+        if DB._logger.isEnabledFor(logging.DEBUG):
+            regions_name = [region.name for region in regions]
+            DB._logger.debug(f"Getting the stars's source_id for regions: {', '.join(regions_name)} from DB ...")
 
         try:
-            gaiadr2_t = self.metadata.tables['gaiadr2_source']
+            regions_id = self.get_regions_id(regions=regions)
+
+            buffer = io.BytesIO()
+            with self._cursor() as cursor:
+                query = cursor.mogrify(
+                    "SELECT region_id, source_id FROM public.gaiadr2_source WHERE region_id = ANY(%s)",
+                    (list(regions_id.values()), )).decode(cursor.connection.encoding)
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+        except Exception as error:
+            DB._logger.error(f"An error ocurred recovering stars source_id from DB. Cause: {error}")
+            raise error
 
-            region_ids = list(self.get_regions_id(regions=regions).values())
-            select_stmt = select([gaiadr2_t.c.source_id
-                                  ]).select_from(gaiadr2_t).where(gaiadr2_t.c.region_id == any_(region_ids)).order_by(
-                                      gaiadr2_t.c.region_id, gaiadr2_t.c.source_id)
+        region_column, source_ids = DB._binary_copy_columns(buffer.getbuffer(), dtypes=['>i4', '>i8'])
 
+        # Rows are sorted by region and source_id with NumPy, so only one set or array is built per region
+        order = np.lexsort((source_ids, region_column))
+        region_column, source_ids = region_column[order], source_ids[order]
+        serials, starts = np.unique(region_column, return_index=True)
+
+        result = {region.name: np.empty(0, dtype=np.int64) if as_array else set() for region in regions}
+        regions_name = {serial: name for name, serial in regions_id.items()}
+        for serial, group in zip(serials.tolist(), np.split(source_ids, starts[1:])):
+            result[regions_name[serial]] = group if as_array else set(group.tolist())
+
+        return result
+
+    def get_max_source_id(self, region: Region) -> Union[SourceID, None]:
+        """
+        Get the greatest source_id of the stars available in the database for the given region.
+
+        Stars are downloaded from Gaia DR2 sorted by source_id, so this value can be used
+        as a watermark to resume the download of a region instead of excluding every saved star.
+
+        Args:
+            region (Region): The region that contains the stars of interest.
+
+        Returns:
+            Union[SourceID, None]: The greatest source_id saved for the region, or None if the region has no stars.
+        """
+        DB._logger.debug(f"Getting the max source_id for region: {region.name} from DB ...")
+
+        region_id = self.get_regions_id(regions={region}).get(region.name)
+        if region_id is None:
+            return None
+
+        try:
             with self.engine.connect() as connection:
-                result = connection.execute(select_stmt).fetchall()
+                result = DB._execute_prepared(connection,
+                                              name='get_max_source_id',
+                                              statement="""
+                                                  SELECT max(source_id) FROM public.gaiadr2_source
+                                                  WHERE region_id = $1::integer
+                                                  """,
+                                              params=(region_id, )).scalar()
         except Exception as error:
-            DB._logger.error(f"An error ocurred recovering stars source_id from DB. Cause: {error}")
+            DB._logger.error(f"An error ocurred recovering max source_id from DB. Cause: {error}")
+            raise error
+
+        return result
+
+    def get_max_source_ids(self, regions: Regions) -> Dict[str, Union[SourceID, None]]:
+        """
+        Get the greatest source_id of the stars available in the database for each one of the given regions.
+
+        Every region is fetched with a single grouped query, so many regions cost one round trip.
+
+        Args:
+            regions (Regions): The regions that contain the stars of interest.
+
+        Returns:
+            Dict[str, Union[SourceID, None]]: A dictionary relating region names with the greatest source_id
+                of their stars, or None if the region has no stars.
+        """
+        DB._logger.debug(f"Getting the max source_id for {len(regions)} regions from DB ...")
+
+        result = {region.name: None for region in regions}
+        try:
+            regions_id = self.get_regions_id(regions=regions)
+            if len(regions_id) == 0:
+                return result
+
+            with self._cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT region_id, max(source_id) FROM public.gaiadr2_source
+                    WHERE region_id = ANY(%s)
+                    GROUP BY region_id
+                    """, (list(regions_id.values()), ))
+                rows = cursor.fetchall()
+        except Exception as error:
+            DB._logger.error(f"An error ocurred recovering max source_id from DB. Cause: {error}")
             raise error
 
-        return set(map(lambda x: next(iter(x)), result))
+        regions_name = {serial: name for name, serial in regions_id.items()}
+        for serial, max_source_id in rows:
+            result[regions_name[serial]] = max_source_id
 
-    def get_regions(self, names: Set[str] = {}, as_dataframe: bool = False) -> Union[Catalogue, pd.DataFrame]:
+        return result
+
+    def get_regions(self, names: Iterable[str] = (), as_dataframe: bool = False) -> Union[Catalogue, pd.DataFrame]:
         """
         Get the regions matching the given names.
 
         Args:
-            names (Set[str]): A set with the names with the regions to retrieve.
+            names (Iterable[str], optional): The names of the regions to retrieve. Defaults to all regions.
             as_dataframe (bool, optional): Flag to recover regions as a DataFrame. Defaults to False.
 
         Returns:
@@ -141,18 +315,20 @@ class DB:
         columns = ('name', 'ra', 'dec', 'diam', 'width', 'height')
         query = f"SELECT {', '. join(columns)} FROM public.regions"
 
+        names = sorted(frozenset(names))
+
         params = dict()
-        if len(names) > 0:
-            DB._logger.debug(f"Getting regions: {names} from DB ...")
+        if names:
+            if DB._logger.isEnabledFor(logging.DEBUG):
+                DB._logger.debug(f"Getting regions: {', '.join(names)} from DB ...")
             query += " WHERE name = ANY(%(regions_name)s)"
-            params['regions_name'] = list(names)
+            params['regions_name'] = names
         else:
             DB._logger.debug(f"Getting all regions from DB ...")
 
         if as_dataframe:
-            index_col = 'name'
             try:
-                return pd.read_sql_query(query, self.engine, index_col=index_col, params=params)
+                return self._copy_query(query, params=params, table='regions', index_col='name')
             except Exception as error:
                 DB._logger.error(f"An error ocurred recovering regions dataframe from DB. Cause: {error}")
                 raise error
@@ -164,19 +340,27 @@ class DB:
             DB._logger.error(f"An error ocurred recovering regions catalogue from DB. Cause: {error}")
             raise error
 
+        result = [row for row in result if row[0] is not None]
+        if len(result) == 0:
+            return dict()
+
+        # Coordinates and sizes are built once for all regions and then indexed per region,
+        # which is much cheaper than creating a SkyCoord and Quantity objects for every row
+        names, ra, dec, diam, width, height = zip(*result)
+        coords = SkyCoord(ra=np.array(ra, dtype=float) * u.degree,
+                          dec=np.array(dec, dtype=float) * u.degree,
+                          frame="icrs")
+        diams, widths, heights = (u.Quantity(np.array(values, dtype=float), u.arcmin)
+                                  for values in (diam, width, height))
+
         catalogue = dict()
-        for (name, ra, dec, diam, width, height) in result:
-            if name is None:
-                continue
-
-            coords = SkyCoord(f"{ra} {dec}", unit=(u.degree, u.degree), frame="icrs")
-            properties = dict()
-            if diam is not None:
-                properties = {'diam': u.Quantity(diam, u.arcmin)}
+        for i, name in enumerate(names):
+            if diam[i] is not None:
+                properties = {'diam': diams[i]}
             else:
-                properties = {'width': u.Quantity(width, u.arcmin), 'height': u.Quantity(height, u.arcmin)}
+                properties = {'width': widths[i], 'height': heights[i]}
 
-            catalogue[name] = Region(name=name, coords=coords, **properties)
+            catalogue[name] = Region(name=name, coords=coords[i], **properties)
 
         return catalogue
 
@@ -186,26 +370,39 @@ class DB:
                   limit: int = None,
                   use_region_id: bool = True,
                   extra_size: float = 1.0,
-                  filter_null_columns: Union[bool, Set[str]] = False) -> pd.DataFrame:
+                  filter_null_columns: Union[bool, Set[str]] = False,
+                  ordered: bool = False,
+                  chunksize: int = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
         """
         Returns a Pandas DataFrame containing the stars of the given region.
 
+        Requesting only the needed columns and leaving the stars unordered
+        reduces the data transferred and avoids sorting them in the database.
+        Limited queries are always sorted, so they return the same stars every time.
+
         Args:
             region (Region): The region which contains the stars.
-            columns (List[str], optional): A list with the data fields to be recovered. Defaults all columns.
-            limit (int, optional): The maximum number of stars to be recovered. Defaults no limit.
+            columns (List[str], optional): A list with the data fields to be recovered. Use ['*'] to recover all columns. Defaults to DEFAULT_STAR_COLUMNS.
+            limit (int, optional): The maximum number of stars to be recovered, sorted by region_id and source_id.
+                Defaults no limit.
             use_region_id (bool, optional): Use the region_id to get stars. If False select starts by position fields. Defaults to True.
             extra_size (float, optional): A positive number to extend the region which contains the stars to be recovered. Defaults to 1.0.
             filter_null_columns (Union[bool, Set[str]], optional): Filter entries with null values in the given columns. Defaults to False.
+            ordered (bool, optional): Sort the stars by region_id and source_id. Defaults to False.
+            chunksize (int, optional): If given, stars are streamed through a server-side cursor and an iterator of DataFrames
+                with at most chunksize stars is returned, so only one chunk is held in memory at a time. Defaults to None.
 
         Returns:
-            DataFrame: A Pandas DataFrame with the recovered stars
+            Union[DataFrame, Iterator[DataFrame]]: A Pandas DataFrame with the recovered stars, or an iterator of them if chunksize is given
         """
         DB._logger.debug(f"Getting stars for region {region}")
 
+        if columns is None:
+            columns = DEFAULT_STAR_COLUMNS
+
         index_columns = ['region_id', 'source_id']
-        if columns is not None and '*' not in columns:
-            columns = index_columns + list(filter(lambda x: x not in index_columns, columns))
+        if '*' not in columns:
+            columns = index_columns + [column for column in columns if column not in index_columns]
         else:
             columns = ['*']
 
@@ -216,7 +413,8 @@ class DB:
 
         params = dict()
         if use_region_id:
-            region_ids = self.get_regions_id(regions=set([region])).values()
+            # The region id is passed as a literal, so only the partition of the region is scanned
+            region_ids = self.get_regions_id(regions={region}).values()
             if len(region_ids) == 0:
                 raise RuntimeError(f"Region '{region.name}' is not available in DB")
             params['region_id'] = next(iter(region_ids))
@@ -225,26 +423,20 @@ class DB:
                 """
         else:
             # https://www.postgresql.org/docs/current/functions-geometry.html
+            # Conditions are written against POINT(ra, dec) so the gist index on that expression can be used
+            ra, dec = region.ra_deg, region.dec_deg
             if hasattr(region, 'diam'):
-                params.update({
-                    'ra': region.coords.ra.degree,
-                    'dec': region.coords.dec.degree,
-                    'radius': region.diam.to_value(u.degree) * extra_size / 2.0
-                })
+                params.update({'ra': ra, 'dec': dec, 'radius': region.diam_deg * extra_size / 2.0})
 
                 query += """
-                    CIRCLE(POINT(%(ra)s, %(dec)s), %(radius)s) @> POINT(ra, dec)
+                    POINT(ra, dec) <@ CIRCLE(POINT(%(ra)s, %(dec)s), %(radius)s)
                     """
             else:
-                params.update({
-                    'ra1': region.coords.ra.degree - region.width.to_value(u.degree) / 2.0,
-                    'dec1': region.coords.dec.degree - region.height.to_value(u.degree) / 2.0,
-                    'ra2': region.coords.ra.degree + region.width.to_value(u.degree) / 2.0,
-                    'dec2': region.coords.dec.degree + region.height.to_value(u.degree) / 2.0
-                })
+                ra1, dec1, ra2, dec2 = DB._box_bounds(ra, dec, region.width_deg, region.height_deg)
+                params.update({'ra1': ra1, 'dec1': dec1, 'ra2': ra2, 'dec2': dec2})
 
                 query += """
-                    BOX(POINT(%(ra1)s, %(dec1)s), POINT(%(ra2)s, %(dec2)s)) @> POINT(ra, dec)
+                    POINT(ra, dec) <@ BOX(POINT(%(ra1)s, %(dec1)s), POINT(%(ra2)s, %(dec2)s))
                     """
 
         if isinstance(filter_null_columns, bool):
@@ -252,18 +444,19 @@ class DB:
                 if '*' in columns:
                     query += "AND gaiadr2_source IS NOT NULL"
                 else:
-                    columns = list(filter(lambda column: column not in index_columns, columns))
-                    query += " ".join(list(map(lambda column: f"AND {column} IS NOT NULL", columns)))
+                    query += " ".join(f"AND {column} IS NOT NULL" for column in columns if column not in index_columns)
         elif len(filter_null_columns) > 0:
             if '*' in filter_null_columns:
                 query += "AND gaiadr2_source IS NOT NULL"
             else:
-                filter_null_columns = set(filter(lambda column: column not in index_columns, filter_null_columns))
-                query += " ".join(list(map(lambda column: f"AND {column} IS NOT NULL", filter_null_columns)))
+                filter_null_columns = {column for column in filter_null_columns if column not in index_columns}
+                query += " ".join(f"AND {column} IS NOT NULL" for column in filter_null_columns)
 
-        query += """
-            ORDER BY region_id, source_id ASC
-            """
+        # A limit without a sort order would return an arbitrary subset of the stars
+        if ordered or limit is not None:
+            query += """
+                ORDER BY region_id, source_id ASC
+                """
 
         if limit is not None:
             params['limit'] = limit
@@ -272,7 +465,11 @@ class DB:
                 """
 
         try:
-            return pd.read_sql_query(query, self.engine, index_col=index_columns, params=params)
+            return self._copy_query(query,
+                                    params=params,
+                                    table='gaiadr2_source',
+                                    index_col=index_columns,
+                                    chunksize=chunksize)
         except Exception as error:
             DB._logger.error(f"An error ocurred recovering data for region: {region} from DB. Cause: {error}")
             raise error
@@ -284,63 +481,520 @@ class DB:
         Args:
             regions (Regions): The regions to be saved into the database.
         """
-        regions_name = list(map(lambda x: x.name, regions))
-        DB._logger.debug(f"Saving regions: {', '. join(regions_name)} into db ...")
-
-        data = []
-        for region in regions:
-            entry = {
-                'name': region.name,
-                'ra': region.coords.ra.degree,
-                'dec': region.coords.dec.degree,
-                'diam': region.diam.value,
-                'properties': dict()
-            }
-
-            if isinstance(region, OpenCluster):
-                entry['properties'] = {'g1_class': region.g1_class, 'trumpler': region.trumpler}
-
-            data.append(entry)
+        regions = list(regions)
+        if DB._logger.isEnabledFor(logging.DEBUG):
+            regions_name = [region.name for region in regions]
+            DB._logger.debug(f"Saving regions: {', '. join(regions_name)} into db ...")
+
+        # Properties are built by the database from their fields, so no JSON is serialized in Python
+        clusters = [isinstance(region, OpenCluster) for region in regions]
+        params = ([region.name for region in regions], [region.ra_deg for region in regions],
+                  [region.dec_deg for region in regions], [region.diam.value for region in regions], clusters,
+                  [region.g1_class if cluster else None for region, cluster in zip(regions, clusters)],
+                  [region.trumpler if cluster else None for region, cluster in zip(regions, clusters)])
 
         try:
-            regions_table = self.metadata.tables['regions']
-
-            # https://docs.sqlalchemy.org/en/13/dialects/postgresql.html
-            # https://docs.sqlalchemy.org/en/13/dialects/postgresql.html#sqlalchemy.dialects.postgresql.Insert.on_conflict_do_update
-            insert_stmt = insert(regions_table).values(data).returning(regions_table.c.id)
-            do_update_stmt = insert_stmt.on_conflict_do_update(index_elements=['name'],
-                                                               set_=dict(properties=insert_stmt.excluded.properties))
-
-            with self.engine.connect() as connection:
-                serials = connection.execute(do_update_stmt).fetchall()
+            with self.engine.begin() as connection:
+                result = DB._execute_prepared(connection,
+                                              name='save_regions',
+                                              statement="""
+                                                  INSERT INTO public.regions (name, ra, dec, diam, properties)
+                                                  SELECT name, ra, dec, diam,
+                                                         CASE WHEN cluster
+                                                              THEN jsonb_build_object('g1_class', g1_class,
+                                                                                      'trumpler', trumpler)
+                                                              ELSE '{}'::jsonb
+                                                         END
+                                                  FROM unnest($1::text[], $2::float8[], $3::float8[],
+                                                              $4::float8[], $5::boolean[], $6::text[], $7::text[])
+                                                      AS t (name, ra, dec, diam, cluster, g1_class, trumpler)
+                                                  ON CONFLICT (name) DO UPDATE SET properties = EXCLUDED.properties
+                                                  RETURNING name, id
+                                                  """,
+                                              params=params).fetchall()
         except Exception as error:
             DB._logger.error(f"An error ocurred saving regions data into DB. Cause: {error}")
             raise error
 
-        for region, serial in zip(regions, serials):
-            region.serial = next(iter(serial))
+        # Serials are matched by name, since RETURNING does not guarantee the insertion order
+        self._regions_id.update(result)
+        for region in regions:
+            region.serial = self._regions_id[region.name]
 
-    def save_stars(self, region: Region, stars: pd.DataFrame):
+    def save_stars(self, region: Region, stars: Union[pd.DataFrame, Table]):
         """
         Save the stars associated to the given region into the database.
 
+        Stars are sent to the database with a binary COPY. Every column is encoded
+        with NumPy at once, so numbers are never formatted as text nor parsed back by the server.
+
         Args:
             region (Region): The region containing the stars.
-            starts (pd.DataFrame): The DataFrame with the stars to be saved into the database.
+            starts (Union[pd.DataFrame, Table]): The DataFrame or astropy Table with the stars to be saved into the database.
+
+        Raises:
+            ValueError: If stars contains columns not available in the gaiadr2_source table.
         """
         DB._logger.debug(f"Saving stars for region {region} into db ...")
 
-        stars.insert(0, "region_id", np.full(len(stars), fill_value=region.serial, dtype=np.int32))
-        stars.set_index(['region_id', 'source_id'], inplace=True)
+        columns, dtypes = self._stars_columns(tuple(stars.columns))
+        values = [DB._column_values(stars[column]) for column in stars.columns]
+
+        copy_stars = functools.partial(DB._copy_columns,
+                                       table='gaiadr2_source_stage',
+                                       columns=columns,
+                                       values=values,
+                                       dtypes=dtypes)
+        saved_stars = self._save_staged_stars(region, columns=columns, copy_stars=copy_stars)
+
+        skipped_stars = len(stars) - saved_stars
+        if skipped_stars > 0:
+            DB._logger.debug(f"Skipped {skipped_stars} stars already saved for region {region}")
+
+    def save_stars_csv(self, region: Region, file: IO[bytes]) -> int:
+        """
+        Save the stars associated to the given region from a CSV file into the database.
+
+        The file is streamed to the database with COPY, so stars are never loaded in memory.
+
+        Args:
+            region (Region): The region containing the stars.
+            file (IO[bytes]): A binary file object with the stars in CSV format.
+                Its first line must be a header with the gaiadr2_source column names.
+
+        Returns:
+            int: The number of saved stars.
+
+        Raises:
+            ValueError: If the file contains columns not available in the gaiadr2_source table.
+        """
+        DB._logger.debug(f"Saving stars for region {region} from CSV into db ...")
+
+        header = file.readline().decode('utf-8').strip()
+        csv_columns = tuple(column.strip('"') for column in header.split(','))
+        columns, _ = self._stars_columns(csv_columns)
 
+        def copy_stars(cursor):
+            cursor.copy_expert(f"COPY gaiadr2_source_stage ({columns}) FROM STDIN WITH (FORMAT csv)", file)
+
+        return self._save_staged_stars(region, columns=columns, copy_stars=copy_stars)
+
+    def _save_staged_stars(self, region: Region, columns: str, copy_stars: Callable) -> int:
+        """
+        Save the stars copied by `copy_stars` into a staging table into gaiadr2_source.
+
+        Stars are copied into a staging table and then moved into gaiadr2_source,
+        so already saved stars are skipped instead of aborting the whole COPY.
+        The staging table is created once per pooled connection and emptied on every commit.
+
+        Args:
+            region (Region): The region containing the stars.
+            columns (str): The comma separated gaiadr2_source columns to be saved, except region_id.
+            copy_stars (Callable): A function copying the stars into gaiadr2_source_stage with the given cursor.
+                The region_id column is filled when stars are moved into gaiadr2_source.
+
+        Returns:
+            int: The number of saved stars.
+        """
         try:
-            with self.engine.connect() as connection:
-                stars.to_sql('gaiadr2_source',
-                             con=connection,
-                             if_exists='append',
-                             index=True,
-                             chunksize=5_000,
-                             method='multi')
+            with self._cursor() as cursor:
+                # Stars can be downloaded again from Gaia, so the commit does not wait for the WAL flush
+                cursor.execute("""
+                    SET LOCAL synchronous_commit = off;
+                    SET LOCAL client_min_messages = warning;
+                    CREATE TEMP TABLE IF NOT EXISTS gaiadr2_source_stage ON COMMIT DELETE ROWS
+                    AS SELECT * FROM public.gaiadr2_source WITH NO DATA
+                    """)
+                copy_stars(cursor)
+                cursor.execute(
+                    f"""
+                    INSERT INTO public.gaiadr2_source (region_id, {columns})
+                    SELECT %s, {columns} FROM gaiadr2_source_stage
+                    ON CONFLICT (region_id, source_id) DO NOTHING
+                    """, (region.serial, ))
+                return cursor.rowcount
         except Exception as error:
             DB._logger.error(f"An error ocurred saving stars data into DB. Cause: {error}")
             raise error
+
+    def _stars_columns(self, columns: Tuple[str, ...]) -> Tuple[str, List[Union[np.dtype, None]]]:
+        """
+        Get the comma separated gaiadr2_source columns used to save stars with the given columns,
+        and the binary COPY types of those columns.
+
+        Columns are validated only the first time they are seen,
+        since every partition downloaded from Gaia has the same columns.
+
+        Args:
+            columns (Tuple[str, ...]): The columns of the stars to be saved.
+
+        Returns:
+            Tuple[str, List[Union[np.dtype, None]]]: The given columns comma separated, and their binary COPY types.
+
+        Raises:
+            ValueError: If any column is not available in the gaiadr2_source table.
+        """
+        if columns not in self._stars_columns_cache:
+            gaiadr2_t = self.metadata.tables['gaiadr2_source']
+            unknown_columns = [column for column in columns if column not in gaiadr2_t.columns]
+            if len(unknown_columns) > 0:
+                raise ValueError(f"Unknown gaiadr2_source columns: {', '.join(unknown_columns)}")
+
+            dtypes = [DB._binary_copy_dtype(gaiadr2_t.columns[column].type) for column in columns]
+            self._stars_columns_cache[columns] = ', '.join(columns), dtypes
+
+        return self._stars_columns_cache[columns]
+
+    @staticmethod
+    def _execute_prepared(connection, name: str, statement: str, params: tuple):
+        """
+        Execute a statement through a server-side prepared statement.
+
+        The statement is prepared the first time it is used on each pooled connection,
+        so later executions skip parsing and planning in the server.
+
+        Args:
+            connection: A SQLAlchemy connection.
+            name (str): The name of the prepared statement.
+            statement (str): The statement to be prepared, with $1, $2, ... placeholders.
+            params (tuple): The parameters of the statement.
+
+        Returns:
+            The result of the statement execution.
+        """
+        prepared_statements = connection.info.setdefault('prepared_statements', set())
+        if name not in prepared_statements:
+            connection.exec_driver_sql(f"PREPARE {name} AS {statement}")
+            prepared_statements.add(name)
+
+        placeholders = ', '.join(['%s'] * len(params))
+        return connection.exec_driver_sql(f"EXECUTE {name} ({placeholders})", [params])
+
+    @contextmanager
+    def _cursor(self, name: str = None):
+        """
+        Context manager yielding a psycopg2 cursor from a pooled connection.
+
+        The transaction is committed when the block succeeds and rolled back otherwise.
+        The connection is always given back to the engine pool.
+
+        Args:
+            name (str, optional): If given, a server-side cursor with this name is created,
+                so results are fetched from the server in batches. Defaults to None.
+
+        Yields:
+            A psycopg2 cursor.
+        """
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor(name=name) as cursor:
+                yield cursor
+            connection.commit()
+        except Exception as error:
+            connection.rollback()
+            raise error
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _copy_columns(cursor, table: str, columns: str, values: List[Tuple[np.ndarray, np.ndarray]],
+                      dtypes: List[Union[np.dtype, None]]):
+        """
+        Copy the given columns into a table using a binary COPY ... FROM STDIN.
+
+        Rows are sent in batches of `DB._copy_batch_size`, so the binary
+        representation of a large partition is never held in memory at once.
+
+        Args:
+            cursor: A psycopg2 cursor.
+            table (str): The table where rows are copied.
+            columns (str): The comma separated columns of the rows.
+            values (List[Tuple[np.ndarray, np.ndarray]]): The (data, mask) arrays of every column.
+            dtypes (List[Union[np.dtype, None]]): The binary COPY type of every column.
+        """
+        copy_stmt = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT binary)"
+
+        number_of_rows = len(values[0][0])
+        for start in range(0, number_of_rows, DB._copy_batch_size):
+            batch = slice(start, start + DB._copy_batch_size)
+            data = DB._binary_copy_data([(data[batch], mask[batch]) for data, mask in values], dtypes)
+            cursor.copy_expert(copy_stmt, io.BytesIO(data))
+
+    def _copy_query(self,
+                    query: str,
+                    params: dict,
+                    table: str,
+                    index_col: Union[str, List[str]] = None,
+                    chunksize: int = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """
+        Run the given query through COPY ... TO STDOUT and load the result into a DataFrame.
+
+        The result is parsed by pandas column by column instead of being
+        fetched as Python objects row by row, which is much faster for wide tables.
+
+        When chunksize is given, the query is streamed through a server-side cursor instead,
+        so only one chunk of rows is held in memory at a time. The query is run lazily,
+        when the returned iterator is first consumed.
+
+        Args:
+            query (str): The SELECT query to be run.
+            params (dict): The parameters of the query.
+            table (str): The table whose column types are used to parse the result.
+            index_col (Union[str, List[str]], optional): The column or columns to be used as index. Defaults to None.
+            chunksize (int, optional): If given, return an iterator of DataFrames with at most chunksize rows. Defaults to None.
+
+        Returns:
+            Union[pd.DataFrame, Iterator[pd.DataFrame]]: The result of the query.
+        """
+        table_columns = self.metadata.tables[table].columns
+        dtypes = {column.name: column.type.python_type for column in table_columns}
+        bool_columns = [name for name, dtype in dtypes.items() if dtype is bool]
+        dtypes = {name: dtype for name, dtype in dtypes.items() if dtype in (float, str)}
+
+        if chunksize is not None:
+            numeric_columns = [column.name for column in table_columns if column.type.python_type in (int, float)]
+            return self._fetch_chunks(query,
+                                      params=params,
+                                      numeric_columns=numeric_columns,
+                                      index_col=index_col,
+                                      chunksize=chunksize)
+
+        buffer = io.StringIO()
+        with self._cursor() as cursor:
+            # Send floats with all their digits so they are parsed back without loss
+            cursor.execute("SET LOCAL extra_float_digits = 3")
+            query = cursor.mogrify(query, params).decode(cursor.connection.encoding)
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+
+        buffer.seek(0)
+        df = pd.read_csv(buffer, index_col=index_col, dtype=dtypes, float_precision='round_trip')
+
+        for column in df.columns.intersection(bool_columns):
+            df[column] = df[column].map({'t': True, 'f': False})
+
+        return df
+
+    def _fetch_chunks(self, query: str, params: dict, numeric_columns: List[str], index_col: Union[str, List[str]],
+                      chunksize: int) -> Iterator[pd.DataFrame]:
+        """
+        Run the given query through a server-side cursor and yield its result in DataFrames of chunksize rows.
+
+        Args:
+            query (str): The SELECT query to be run.
+            params (dict): The parameters of the query.
+            numeric_columns (List[str]): The integer and float columns of the table.
+            index_col (Union[str, List[str]]): The column or columns to be used as index, or None.
+            chunksize (int): The maximum number of rows of each DataFrame.
+
+        Yields:
+            pd.DataFrame: The next chunk of the result.
+        """
+        with self._cursor(name='cdalvaro_fetch_chunks') as cursor:
+            with cursor.connection.cursor() as settings:
+                # Send floats with all their digits so they are parsed back without loss
+                settings.execute("SET LOCAL extra_float_digits = 3")
+
+            cursor.itersize = chunksize
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if len(rows) == 0:
+                    break
+
+                columns = [column[0] for column in cursor.description]
+                df = pd.DataFrame.from_records(rows, columns=columns)
+                # Numeric columns with only NULL values in this chunk are left as objects,
+                # so they are parsed as floats like NULL values in the COPY path
+                null_columns = [column for column in numeric_columns if column in df and df[column].dtype == object]
+                df = df.astype({column: float for column in null_columns})
+                if index_col is not None:
+                    df = df.set_index(index_col)
+                yield df
+
+    @staticmethod
+    def _binary_copy_columns(data: memoryview, dtypes: List[str]) -> List[np.ndarray]:
+        """
+        Decode the output of a binary COPY with non null fixed size columns.
+
+        https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+
+        Args:
+            data (memoryview): The binary COPY output.
+            dtypes (List[str]): The big-endian NumPy types of the columns. E.g.: '>i8' for bigint columns.
+
+        Returns:
+            List[np.ndarray]: The values of every column.
+
+        Raises:
+            ValueError: If data does not match the given columns.
+        """
+        # 19 bytes header, then (int16 fields count, (int32 field length, value) per field) per row and a 2 bytes trailer
+        header_size, trailer_size = 19, 2
+        fields = [('fields', '>i2')]
+        for i, dtype in enumerate(dtypes):
+            fields += [(f"length_{i}", '>i4'), (f"value_{i}", dtype)]
+        row_dtype = np.dtype(fields)
+
+        rows = np.frombuffer(data,
+                             dtype=row_dtype,
+                             offset=header_size,
+                             count=(len(data) - header_size - trailer_size) // row_dtype.itemsize)
+        valid = (rows['fields'] == len(dtypes)).all()
+        for i, dtype in enumerate(dtypes):
+            valid &= (rows[f"length_{i}"] == np.dtype(dtype).itemsize).all()
+        if not valid:
+            raise ValueError(f"Binary COPY data does not match non null columns of types: {', '.join(dtypes)}")
+
+        return [rows[f"value_{i}"].astype(np.dtype(dtype).newbyteorder('=')) for i, dtype in enumerate(dtypes)]
+
+    @staticmethod
+    def _binary_copy_dtype(column_type: sqltypes.TypeEngine) -> Union[np.dtype, None]:
+        """
+        Get the NumPy type used to send values of the given column type with a binary COPY.
+
+        Args:
+            column_type (sqltypes.TypeEngine): The type of the column.
+
+        Returns:
+            Union[np.dtype, None]: The big-endian NumPy type of the column, or None for text columns.
+
+        Raises:
+            ValueError: If the column type is not supported.
+        """
+        if isinstance(column_type, sqltypes.Boolean):
+            return np.dtype('?')
+        if isinstance(column_type, sqltypes.BigInteger):
+            return np.dtype('>i8')
+        if isinstance(column_type, sqltypes.SmallInteger):
+            return np.dtype('>i2')
+        if isinstance(column_type, sqltypes.Integer):
+            return np.dtype('>i4')
+        if isinstance(column_type, sqltypes.REAL):
+            return np.dtype('>f4')
+        if isinstance(column_type, sqltypes.Float):
+            return np.dtype('>f8')
+        if isinstance(column_type, sqltypes.String):
+            return None
+
+        raise ValueError(f"Column type {column_type} is not supported by binary COPY")
+
+    @staticmethod
+    def _binary_copy_data(values: List[Tuple[np.ndarray, np.ndarray]], dtypes: List[Union[np.dtype, None]]) -> bytes:
+        """
+        Encode the given columns with the binary COPY format.
+
+        https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+
+        Every field is written for all the rows of its column at once,
+        so no Python object is created per cell except for text columns.
+
+        Args:
+            values (List[Tuple[np.ndarray, np.ndarray]]): The (data, mask) arrays of every column.
+                Masked values are sent as NULL.
+            dtypes (List[Union[np.dtype, None]]): The binary COPY type of every column. None for text columns.
+
+        Returns:
+            bytes: The binary COPY data.
+        """
+        header = b'PGCOPY\n\xff\r\n\x00' + bytes(8)
+        trailer = b'\xff\xff'
+
+        # Field lengths are -1 for NULL values
+        fields = []
+        for (data, mask), dtype in zip(values, dtypes):
+            if dtype is None:
+                encoded = [value if isinstance(value, bytes) else str(value).encode('utf-8') for value in data.tolist()]
+                data = np.array(encoded, dtype=bytes)
+                lengths = np.fromiter(map(len, encoded), dtype=np.int32, count=len(encoded))
+                lengths[mask] = -1
+            else:
+                # Masked values, e.g. pd.NA, might not be convertible to the column type
+                data = (np.where(mask, 0, data) if mask.any() else data).astype(dtype, copy=False)
+                lengths = np.where(mask, np.int32(-1), np.int32(dtype.itemsize))
+            fields.append((data, lengths))
+
+        return header + DB._binary_copy_fields(fields) + trailer
+
+    @staticmethod
+    def _binary_copy_fields(fields: List[Tuple[np.ndarray, np.ndarray]]) -> bytes:
+        """
+        Encode the given columns with the binary COPY format field by field.
+
+        Each field is written for all the rows of its column at once, scattering
+        its bytes into the output buffer.
+
+        Args:
+            fields (List[Tuple[np.ndarray, np.ndarray]]): The (data, lengths) arrays of every column.
+
+        Returns:
+            bytes: The binary COPY rows, without header nor trailer.
+        """
+        number_of_rows = len(fields[0][1])
+
+        # Every row starts with the int16 number of fields, and every field with its int32 length
+        row_sizes = np.full(number_of_rows, 2, dtype=np.int64)
+        for _, lengths in fields:
+            row_sizes += 4 + np.maximum(lengths, 0)
+
+        buffer = np.empty(row_sizes.sum(), dtype=np.uint8)
+        positions = np.cumsum(row_sizes) - row_sizes
+        buffer[positions[:, None] + np.arange(2)] = np.full(number_of_rows, len(fields), dtype='>i2').view(
+            np.uint8).reshape(-1, 2)
+        positions += 2
+
+        for data, lengths in fields:
+            buffer[positions[:, None] + np.arange(4)] = lengths.astype('>i4').view(np.uint8).reshape(-1, 4)
+            positions += 4
+
+            not_null = lengths > 0
+            sizes = lengths[not_null].astype(np.int64)
+            if data.dtype.kind == 'S':
+                # Text values are padded to the longest one
+                data = data[not_null].view(np.uint8).reshape(-1, data.dtype.itemsize)
+                data = data[np.arange(data.shape[1]) < sizes[:, None]]
+            else:
+                data = data[not_null].view(np.uint8)
+            offsets = np.cumsum(sizes) - sizes
+            buffer[np.repeat(positions[not_null] - offsets, sizes) + np.arange(len(data))] = data
+            positions += np.maximum(lengths, 0)
+
+        return buffer.tobytes()
+
+    @staticmethod
+    def _box_bounds(ra: float, dec: float, width: float, height: float) -> Tuple[float, float, float, float]:
+        """
+        Compute the corners of a box centered at the given position.
+
+        Every argument is a plain float in degrees, so no Quantity arithmetic is involved.
+
+        Args:
+            ra (float): The right ascension of the center of the box.
+            dec (float): The declination of the center of the box.
+            width (float): The width of the box.
+            height (float): The height of the box.
+
+        Returns:
+            Tuple[float, float, float, float]: The (ra1, dec1, ra2, dec2) corners of the box.
+        """
+        half_width, half_height = width / 2.0, height / 2.0
+        return ra - half_width, dec - half_height, ra + half_width, dec + half_height
+
+    @staticmethod
+    def _column_values(column: Union[pd.Series, Column]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert a DataFrame or astropy Table column into the arrays sent to the database.
+
+        Args:
+            column (Union[pd.Series, Column]): The column to be converted.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The column data and a boolean mask with its missing values.
+        """
+        if isinstance(column, pd.Series):
+            return column.to_numpy(), column.isna().to_numpy()
+
+        # astropy columns carry their mask at the NumPy level, and unmasked NaN are missing values too
+        data, mask = np.asarray(np.ma.getdata(column)), np.ma.getmaskarray(column)
+        if data.dtype.kind == 'f':
+            mask = mask | np.isnan(data)
+        return data, mask
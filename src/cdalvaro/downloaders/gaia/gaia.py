@@ -1,13 +1,16 @@
 import astropy
 from astropy.table import QTable, Table
-import astropy.units as u
 from astroquery import gaia
+from concurrent.futures import ThreadPoolExecutor
+import csv
 import hashlib
 import json
 import logging
 import numpy as np
 import os
-from typing import List, Set, TypeVar, Union
+import tempfile
+import threading
+from typing import List, Set, Tuple, TypeVar, Union
 
 from ..gaia.metadata import GaiaMetadata
 from ...data_base import DB
@@ -33,6 +36,16 @@ class Gaia:
 
     _logger = Logger.instance()
     partition_size: np.int32 = 500_000
+    inline_exclude_size: int = 1_000
+    max_workers: int = 4
+    max_jobs: int = 2
+    batch_size: int = 50
+    stream_results: bool = False
+    range_jobs: int = 1
+    _select_columns = ', '.join(f"A.{column}" for column in GaiaMetadata.columns())
+    _from_table = f"FROM {gaia.Gaia.MAIN_GAIA_TABLE} A"
+    _circle_condition = "1 = CONTAINS(POINT('ICRS', A.ra, A.dec), CIRCLE('ICRS', {ra}, {dec}, {radius}))"
+    _box_condition = "1 = CONTAINS(POINT('ICRS', A.ra, A.dec), BOX('ICRS', {ra}, {dec}, {width}, {height}))"
 
     def __init__(self, db: DB, username: str = None, password: str = None, remove_jobs: bool = True):
         self.db = db
@@ -40,8 +53,9 @@ class Gaia:
         self.password = password
         self.remove_jobs = remove_jobs
         self._logged = False
+        self._jobs_semaphore = threading.Semaphore(Gaia.max_jobs)
 
-    def download_and_save(self, regions: Regions, extra_size: float = 1.0):
+    def download_and_save(self, regions: Regions, extra_size: float = 1.0, incremental: bool = False):
         """
         Download stars information from Gaia DR2 for the given regions
         with an optional extra size to extend the region and save the downloaded
@@ -50,7 +64,19 @@ class Gaia:
         Args:
             regions (Regions): Regions that contain the stars to download.
             extra_size (float, optional): A positive number with the extra size to extend the region. Defaults to 1.0.
+            incremental (bool, optional): Resume each region from the greatest source_id already saved
+                instead of excluding every saved star. Only valid when the previous download of the region
+                used the same extra_size. Partitions are then saved in source_id order and a region stops
+                at its first save error, so the saved stars never leave gaps below the greatest source_id.
+                Defaults to False.
+
+        Raises:
+            ValueError: If incremental is requested while `Gaia.range_jobs` is greater than 1.
         """
+        if incremental and Gaia.range_jobs > 1:
+            # Ranges are saved concurrently, so a failed range could be left behind the greatest saved source_id
+            raise ValueError("incremental downloads require Gaia.range_jobs to be 1")
+
         if extra_size < 0.0:
             extra_size = abs(extra_size)
             Gaia._logger.warn(f"extra_size parameter must be positive. Absolute value will be taken: {(extra_size)}")
@@ -58,51 +84,371 @@ class Gaia:
         Gaia._logger.info("⏱ Starting download ...")
         self._login()
 
-        number_of_regions = len(regions)
-        for counter, region in zip(range(1, number_of_regions + 1), regions):
-            try:
-                Gaia._logger.info(f"({counter} / {number_of_regions}) Downloading {region} stars from Gaia DR2 ...")
-                source_ids = self.db.get_stars_source_id(regions={region})
-                self._download_and_save(region=region, extra_size=extra_size, exclude=source_ids)
-            except Exception as error:
-                Gaia._logger.error(
-                    f"An error occurred while downloading stars for region {region} from Gaia DR2 database. Cause: {error}"
-                )
+        # Regions are processed concurrently, while at most `Gaia.max_jobs` jobs run at the same time in the Gaia server
+        self._jobs_semaphore = threading.Semaphore(Gaia.max_jobs)
+
+        batches, regions = self._batch_regions(regions)
+
+        number_of_tasks = len(batches) + len(regions)
+        with ThreadPoolExecutor(max_workers=Gaia.max_workers) as executor:
+            for counter, batch in enumerate(batches, start=1):
+                executor.submit(self._process_batch,
+                                regions=batch,
+                                extra_size=extra_size,
+                                incremental=incremental,
+                                counter=counter,
+                                number_of_regions=number_of_tasks)
+
+            # The stars already saved are fetched for `Gaia.max_workers` regions at once,
+            # and at most twice that many regions wait for their download with their stars in memory.
+            pending_regions = threading.Semaphore(2 * Gaia.max_workers)
+            for start in range(0, len(regions), Gaia.max_workers):
+                chunk = regions[start:start + Gaia.max_workers]
+                for _ in chunk:
+                    pending_regions.acquire()
+
+                source_ids = dict()
+                if not incremental:
+                    try:
+                        source_ids = self.db.get_stars_source_ids(regions=set(chunk), as_array=True)
+                    except Exception as error:
+                        Gaia._logger.error(f"Unable to get the stars already saved for regions: "
+                                           f"{', '.join(region.name for region in chunk)}. Cause: {error}")
+
+                for counter, region in enumerate(chunk, start=len(batches) + start + 1):
+                    future = executor.submit(self._process_region,
+                                             region=region,
+                                             extra_size=extra_size,
+                                             incremental=incremental,
+                                             counter=counter,
+                                             number_of_regions=number_of_tasks,
+                                             source_ids=source_ids.get(region.name))
+                    future.add_done_callback(lambda _: pending_regions.release())
 
         self._logout()
         Gaia._logger.info(f"🏁 Finished downloading stars")
 
-    def _download_and_save(self, region: Region, extra_size: float, exclude: Set[SourceID] = {}):
+    def _batch_regions(self, regions: Regions) -> Tuple[List[List[Region]], List[Region]]:
+        """
+        Group the regions without stars in the database into batches of `Gaia.batch_size` regions,
+        so each batch is downloaded with a single Gaia job.
+
+        Only circular regions are batched, since their sizes are uploaded along with their coordinates.
+        Regions are sorted by name, so batches and logs are the same for every run.
+
+        Args:
+            regions (Regions): The regions to be downloaded.
+
+        Returns:
+            Tuple[List[List[Region]], List[Region]]: The batches of regions and the regions to be downloaded one by one.
+        """
+        regions = sorted(regions, key=lambda region: region.name)
+        if Gaia.batch_size is None or Gaia.batch_size <= 1:
+            return [], regions
+
+        # The stars saved for every known region are checked with a single query
+        max_source_ids = self.db.get_max_source_ids(regions=set(regions))
+
+        new_regions, saved_regions = [], []
+        for region in regions:
+            if hasattr(region, 'diam') and max_source_ids.get(region.name) is None:
+                new_regions.append(region)
+            else:
+                saved_regions.append(region)
+
+        batches = [new_regions[i:i + Gaia.batch_size] for i in range(0, len(new_regions), Gaia.batch_size)]
+
+        # A single region is cheaper to download without uploading a table
+        if len(batches) > 0 and len(batches[-1]) == 1:
+            saved_regions += batches.pop()
+
+        return batches, saved_regions
+
+    def _process_batch(self, regions: List[Region], extra_size: float, incremental: bool, counter: int,
+                       number_of_regions: int):
+        """
+        Download and save the stars of a batch of regions without stars in the database.
+
+        Args:
+            regions (List[Region]): The regions that contain the stars to be downloaded.
+            extra_size (float): A positive number with the extra size to extend the regions.
+            incremental (bool): Stop the download at the first save error.
+            counter (int): The position of the batch in the download.
+            number_of_regions (int): The total number of batches and regions in the download.
+        """
+        regions_name = ', '.join(region.name for region in regions)
+        try:
+            Gaia._logger.info(f"({counter} / {number_of_regions}) Downloading {regions_name} stars from Gaia DR2 ...")
+            self._download_and_save_batch(regions=regions, extra_size=extra_size, incremental=incremental)
+        except Exception as error:
+            Gaia._logger.error(f"An error occurred while downloading stars for regions {regions_name} "
+                               f"from Gaia DR2 database. Cause: {error}")
+
+    def _process_region(self,
+                        region: Region,
+                        extra_size: float,
+                        incremental: bool,
+                        counter: int,
+                        number_of_regions: int,
+                        source_ids: np.ndarray = None):
+        """
+        Download and save the stars of a single region skipping the stars already saved.
+
+        Args:
+            region (Region): The region that contains the stars to be downloaded.
+            extra_size (float): A positive number with the extra size to extend the region.
+            incremental (bool): Resume the download from the greatest source_id already saved.
+            counter (int): The position of the region in the download.
+            number_of_regions (int): The total number of regions in the download.
+            source_ids (np.ndarray, optional): The sorted source ids of the stars already saved for the region.
+                Defaults to None, to get them from the database.
+        """
+        try:
+            Gaia._logger.info(f"({counter} / {number_of_regions}) Downloading {region} stars from Gaia DR2 ...")
+            if incremental:
+                watermark = self.db.get_max_source_id(region=region)
+                self._download_and_save(region=region, extra_size=extra_size, watermark=watermark, incremental=True)
+            else:
+                if source_ids is None:
+                    source_ids = self.db.get_stars_source_id(regions={region}, as_array=True)
+                self._download_and_save(region=region, extra_size=extra_size, exclude=source_ids)
+        except Exception as error:
+            Gaia._logger.error(
+                f"An error occurred while downloading stars for region {region} from Gaia DR2 database. Cause: {error}")
+
+    def _download_and_save(self,
+                           region: Region,
+                           extra_size: float,
+                           exclude: np.ndarray = None,
+                           watermark: Union[SourceID, None] = None,
+                           incremental: bool = False):
         """
         Download and save stars for the given region.
 
         This operation is partitioned to improve memory management.
         Set `Gaia.partition_size` to change the partition size.
 
+        Each partition is saved in a background thread while the next one is being downloaded,
+        so the Gaia requests and the database writes overlap.
+
+        Partitions are sorted by source_id, so the next partition starts right after
+        the greatest source_id of the previous one instead of excluding every downloaded star.
+
+        Set `Gaia.stream_results` to download each partition into a CSV file which is streamed
+        into the database, instead of loading it as an astropy table.
+
+        Args:
+            region (Region): The region that contains the stars to be downloaded.
+            extra_size (float): A positive number with the extra size to extend the region.
+            exclude (np.ndarray, optional): Sorted source ids to be excluded from the download. Defaults to None.
+            watermark (Union[SourceID, None]): Only stars with a greater source_id are downloaded. Defaults to None.
+            incremental (bool, optional): Stop the download at the first save error, so the greatest saved source_id
+                can be used as the watermark of the next download. Defaults to False.
+        """
+        if exclude is None:
+            exclude = np.empty(0, dtype=np.int64)
+
+        ranges = [(watermark, None)]
+        if Gaia.range_jobs > 1 and Gaia.partition_size is not None:
+            ranges = self._source_id_ranges(region, extra_size=extra_size, watermark=watermark)
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as range_executor, \
+                ThreadPoolExecutor(max_workers=1) as save_executor:
+            futures = [
+                range_executor.submit(self._download_range,
+                                      region=region,
+                                      extra_size=extra_size,
+                                      exclude=exclude,
+                                      watermark=lower,
+                                      upper=upper,
+                                      save_executor=save_executor,
+                                      incremental=incremental) for lower, upper in ranges
+            ]
+            downloaded_stars = sum(future.result() for future in futures)
+
+        if downloaded_stars > 0:
+            Gaia._logger.info(f"Downloaded {downloaded_stars} new stars for region '{region}'")
+        elif len(exclude) > 0 or watermark is not None:
+            Gaia._logger.info(f"No new data has been downloaded from Gaia DR2 for region '{region}'")
+        else:
+            Gaia._logger.warn(f"No data has been found in the Gaia DR2 database for region '{region}'")
+
+    def _download_range(self, region: Region, extra_size: float, exclude: np.ndarray,
+                        watermark: Union[SourceID, None], upper: Union[SourceID, None],
+                        save_executor: ThreadPoolExecutor, incremental: bool = False) -> int:
+        """
+        Download the stars of the given region within a range of source ids partition by partition,
+        and save them with the given executor.
+
         Args:
             region (Region): The region that contains the stars to be downloaded.
             extra_size (float): A positive number with the extra size to extend the region.
-            exclude (Set[SourceID]): Source ids to be excluded from the download. Defaults to {}.
+            exclude (np.ndarray): Sorted source ids to be excluded from the download.
+            watermark (Union[SourceID, None]): Only stars with a greater source_id are downloaded.
+            upper (Union[SourceID, None]): Only stars with a lower or equal source_id are downloaded.
+            save_executor (ThreadPoolExecutor): The executor where partitions are saved.
+            incremental (bool, optional): Raise the first save error instead of logging it,
+                so no later partition is saved. Defaults to False.
+
+        Returns:
+            int: The number of downloaded stars.
         """
-        downloaded_ids = exclude.copy()
+        downloaded_stars = 0
+        pending_save = None
         while True:
-            stars = self._download_partition(region, extra_size=extra_size, exclude=downloaded_ids)
-            if stars is not None and len(stars) > 0:
-                Gaia._logger.debug(f"Downloaded {len(stars)} stars from Gaia DR2 for region '{region}'")
-                downloaded_ids |= set(stars['source_id'])
-                self._save_stars(region=region, stars=stars)
-                if Gaia.partition_size is None or len(stars) < Gaia.partition_size:
-                    Gaia._logger.info(
-                        f"Downloaded {len(downloaded_ids) - len(exclude)} new stars for region '{region}'")
-                    break
+            if Gaia.stream_results:
+                output_file = Gaia._temporary_file()
+                number_of_stars = 0
+                try:
+                    stars = self._download_partition(region,
+                                                     extra_size=extra_size,
+                                                     exclude=exclude,
+                                                     watermark=watermark,
+                                                     upper=upper,
+                                                     output_file=output_file)
+                    number_of_stars, last_source_id = Gaia._csv_summary(stars)
+                finally:
+                    # Files with stars are removed once they are saved, any other one is removed here
+                    if number_of_stars == 0:
+                        os.remove(output_file)
+                save_stars = self._save_stars_csv
             else:
-                if len(exclude) > 0:
-                    Gaia._logger.info(f"No new data has been downloaded from Gaia DR2 for region '{region}'")
-                else:
-                    Gaia._logger.warn(f"No data has been found in the Gaia DR2 database for region '{region}'")
+                stars = self._download_partition(region,
+                                                 extra_size=extra_size,
+                                                 exclude=exclude,
+                                                 watermark=watermark,
+                                                 upper=upper)
+                number_of_stars = 0 if stars is None else len(stars)
+                last_source_id = int(stars['source_id'].max()) if number_of_stars > 0 else None
+                save_stars = self._save_stars
+
+            if number_of_stars == 0:
+                break
+
+            Gaia._logger.debug(f"Downloaded {number_of_stars} stars from Gaia DR2 for region '{region}'")
+            downloaded_stars += number_of_stars
+            watermark = last_source_id
+
+            # Keep at most one partition of this range waiting to be saved
+            if pending_save is not None:
+                try:
+                    pending_save.result()
+                except Exception:
+                    if Gaia.stream_results:
+                        os.remove(stars)
+                    raise
+            pending_save = save_executor.submit(save_stars, region=region, stars=stars, raise_errors=incremental)
+
+            if Gaia.partition_size is None or number_of_stars < Gaia.partition_size:
                 break
 
-    def _download_partition(self, region: Region, extra_size: float, exclude: Set[SourceID] = {}) -> Table:
+        if pending_save is not None:
+            pending_save.result()
+
+        return downloaded_stars
+
+    def _source_id_ranges(self, region: Region, extra_size: float,
+                          watermark: Union[SourceID, None]) -> List[Tuple[Union[SourceID, None], SourceID]]:
+        """
+        Split the source ids of the stars in the given region into up to `Gaia.range_jobs` ranges
+        of the same width, so they can be downloaded concurrently.
+
+        Args:
+            region (Region): The region that contains the stars to be downloaded.
+            extra_size (float): A positive number with the extra size to extend the region.
+            watermark (Union[SourceID, None]): Only stars with a greater source_id are downloaded.
+
+        Returns:
+            List[Tuple[Union[SourceID, None], SourceID]]: The (exclusive lower, inclusive upper) bounds of every range.
+        """
+        query = f"""
+            SELECT COUNT(*) AS stars, MIN(A.source_id) AS min_source_id, MAX(A.source_id) AS max_source_id
+            {Gaia._from_table}
+            WHERE {Gaia._region_condition(region, extra_size)}
+            """
+        if watermark is not None:
+            query += f"""
+                AND A.source_id > {watermark}
+                """
+
+        result = self._launch_job(query, None, None, description=f"region {region} source ids")
+        stars = int(result['stars'][0])
+        number_of_ranges = min(Gaia.range_jobs, -(-stars // Gaia.partition_size))
+        if number_of_ranges <= 1:
+            return [(watermark, None)]
+
+        # Python integers are used since source ids do not fit in a float without losing precision
+        lower, upper = int(result['min_source_id'][0]) - 1, int(result['max_source_id'][0])
+        bounds = [lower + (upper - lower) * i // number_of_ranges for i in range(number_of_ranges + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _download_and_save_batch(self, regions: List[Region], extra_size: float, incremental: bool = False):
+        """
+        Download and save stars for the given regions with a single query per partition.
+
+        Rows are sorted by source_id and region, so the next partition starts right after
+        the last row of the previous one, and are split by region before being saved.
+
+        Args:
+            regions (List[Region]): The regions that contain the stars to be downloaded.
+            extra_size (float): A positive number with the extra size to extend the regions.
+            incremental (bool, optional): Stop the download at the first save error. Defaults to False.
+        """
+        downloaded_stars = np.zeros(len(regions), dtype=np.int64)
+        watermark = None
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending_save = None
+            while True:
+                query, temp_table_name, temp_table = self._compose_batch_query(regions=regions,
+                                                                               extra_size=extra_size,
+                                                                               watermark=watermark)
+                result = self._launch_job(query, temp_table_name, temp_table, description=f"{len(regions)} regions")
+                if result is None or len(result) == 0:
+                    break
+
+                Gaia._logger.debug(f"Downloaded {len(result)} stars from Gaia DR2 for {len(regions)} regions")
+                indexes = np.asarray(result['region_index'])
+                downloaded_stars += np.bincount(indexes, minlength=len(regions))
+                watermark = int(result['source_id'][-1]), int(indexes[-1])
+
+                # Keep at most one partition waiting to be saved
+                if pending_save is not None:
+                    pending_save.result()
+                pending_save = executor.submit(self._save_batch,
+                                               regions=regions,
+                                               result=result,
+                                               raise_errors=incremental)
+
+                if Gaia.partition_size is None or len(result) < Gaia.partition_size:
+                    break
+
+        for region, stars in zip(regions, downloaded_stars.tolist()):
+            if stars > 0:
+                Gaia._logger.info(f"Downloaded {stars} new stars for region '{region}'")
+            else:
+                Gaia._logger.warn(f"No data has been found in the Gaia DR2 database for region '{region}'")
+
+    def _save_batch(self, regions: List[Region], result: Table, raise_errors: bool = False):
+        """
+        Split the stars downloaded for a batch of regions and save them region by region.
+
+        Args:
+            regions (List[Region]): The regions of the batch.
+            result (Table): An astropy table with the downloaded stars and their region_index.
+            raise_errors (bool, optional): Raise save errors instead of logging them. Defaults to False.
+        """
+        indexes = np.asarray(result['region_index'])
+        result.remove_column('region_index')
+        for index in np.unique(indexes).tolist():
+            self._save_stars(region=regions[index], stars=result[indexes == index], raise_errors=raise_errors)
+
+    def _download_partition(self,
+                            region: Region,
+                            extra_size: float,
+                            exclude: np.ndarray = None,
+                            watermark: Union[SourceID, None] = None,
+                            upper: Union[SourceID, None] = None,
+                            output_file: str = None) -> Union[Table, str]:
         """
         Download data from Gaia DR2 for the given region with an optional extra size
         to extend the given region.
@@ -110,20 +456,62 @@ class Gaia:
         Args:
             region (Region): The region that contains the stars to be downloaded.
             extra_size (float): A positive number with the extra size to extend the region.
-            exclude (Set[SourceID]): Source ids to be excluded from the download. Defaults to {}.
+            exclude (np.ndarray, optional): Sorted source ids to be excluded from the download. Defaults to None.
+            watermark (Union[SourceID, None]): Only stars with a greater source_id are downloaded. Defaults to None.
+            upper (Union[SourceID, None]): Only stars with a lower or equal source_id are downloaded. Defaults to None.
+            output_file (str, optional): A CSV file where the data is downloaded. Defaults to None.
+
+        Returns:
+            Union[Table, str]: An astropy table with the downloaded data, or the CSV file if output_file is given.
+        """
+        query, temp_table_name, temp_table = self._compose_query(region=region,
+                                                                 extra_size=extra_size,
+                                                                 exclude=exclude,
+                                                                 watermark=watermark,
+                                                                 upper=upper)
+        return self._launch_job(query,
+                                temp_table_name,
+                                temp_table,
+                                description=f"region {region}",
+                                output_file=output_file)
+
+    def _launch_job(self,
+                    query: str,
+                    temp_table_name: str,
+                    temp_table: Table,
+                    description: str,
+                    output_file: str = None) -> Union[Table, str]:
+        """
+        Launch an asynchronous job in the Gaia DR2 server and get its results.
+
+        Args:
+            query (str): The ADQL query of the job.
+            temp_table_name (str): The name of the table uploaded along with the job, or None.
+            temp_table (Table): The table uploaded along with the job, or None.
+            description (str): A description of the downloaded data for the log messages.
+            output_file (str, optional): A CSV file where results are dumped instead of being loaded. Defaults to None.
 
         Returns:
-            Table: An astropy table with the downloaded data, or None if an error occurs.
+            Union[Table, str]: An astropy table with the downloaded data, or the CSV file if output_file is given.
         """
         job = None
         try:
-            query, temp_table_name, temp_table = self._compose_query(region=region,
-                                                                     extra_size=extra_size,
-                                                                     exclude=exclude)
-            job = gaia.Gaia.launch_job_async(query, upload_resource=temp_table, upload_table_name=temp_table_name)
-            result = job.get_results()
+            with self._jobs_semaphore:
+                if output_file is None:
+                    job = gaia.Gaia.launch_job_async(query,
+                                                     upload_resource=temp_table,
+                                                     upload_table_name=temp_table_name)
+                    result = job.get_results()
+                else:
+                    job = gaia.Gaia.launch_job_async(query,
+                                                     upload_resource=temp_table,
+                                                     upload_table_name=temp_table_name,
+                                                     output_file=output_file,
+                                                     output_format='csv',
+                                                     dump_to_file=True)
+                    result = job.outputFile
         except Exception as error:
-            Gaia._logger.error(f"Error executing job for region {region}. Cause: {error}")
+            Gaia._logger.error(f"Error executing job for {description}. Cause: {error}")
             raise error
         finally:
             if job is not None and self._logged and self.remove_jobs:
@@ -135,7 +523,12 @@ class Gaia:
 
         return result
 
-    def _compose_query(self, region: Region, extra_size: float, exclude: Set[SourceID]) -> str:
+    def _compose_query(self,
+                       region: Region,
+                       extra_size: float,
+                       exclude: Union[np.ndarray, None],
+                       watermark: Union[SourceID, None] = None,
+                       upper: Union[SourceID, None] = None) -> str:
         """
         Compose the query to download data from Gaia DR2 for the given region.
 
@@ -145,83 +538,207 @@ class Gaia:
         Args:
             region (Region): The region that contains the stars to be downloaded.
             extra_size (float): A positive number to extend the given region diameter.
-            exclude (Set[SourceID]): Source ids to be excluded from the download.
+            exclude (Union[np.ndarray, None]): Sorted source ids to be excluded from the download.
+            watermark (Union[SourceID, None]): Only stars with a greater source_id are downloaded. Defaults to None.
+            upper (Union[SourceID, None]): Only stars with a lower or equal source_id are downloaded. Defaults to None.
 
         Returns:
             str: A string with the download query.
         """
-        ra = region.coords.ra.degree
-        dec = region.coords.dec.degree
-
-        query = "SELECT" if Gaia.partition_size is None else f"SELECT TOP {Gaia.partition_size}"
-        query += f"""
-            {', '.join(map(lambda x: f"A.{x}", GaiaMetadata.columns()))}
-            FROM {gaia.Gaia.MAIN_GAIA_TABLE} A
-            """
+        select = "SELECT" if Gaia.partition_size is None else f"SELECT TOP {Gaia.partition_size}"
+        query = [select, Gaia._select_columns, Gaia._from_table]
+        conditions = []
 
         temp_table_name, temp_table = None, None
-        if len(exclude) > 0:
+        if exclude is None:
+            exclude = np.empty(0, dtype=np.int64)
+
+        # Stars out of the range of source ids are not downloaded, so they are not excluded either
+        start = 0 if watermark is None else np.searchsorted(exclude, watermark, side='right')
+        stop = len(exclude) if upper is None else np.searchsorted(exclude, upper, side='right')
+        exclude = exclude[start:stop]
+
+        if len(exclude) > Gaia.inline_exclude_size:
             region_md5 = hashlib.md5(region.name.encode('utf-8')).hexdigest()
             temp_table_name = f"cdalvaro_{region_md5}"
-            temp_table = Table([list(exclude)],
+            temp_table = Table([exclude],
                                names=['source_id'],
-                               dtype=[np.int64],
                                meta={'meta': f"temporary table for region {region}"})
 
-            query += f"""
-                LEFT JOIN tap_upload.{temp_table_name} B
-                        ON A.source_id = B.source_id
-                        WHERE B.source_id IS NULL
-                AND
-                """
-        else:
-            query += """
-                WHERE
-                """
+            query.append(f"LEFT JOIN tap_upload.{temp_table_name} B ON A.source_id = B.source_id")
+            conditions.append("B.source_id IS NULL")
+        elif len(exclude) > 0:
+            # Few source ids are cheaper to send inline than as an uploaded table
+            conditions.append(f"A.source_id NOT IN ({', '.join(map(str, exclude.tolist()))})")
+
+        if watermark is not None:
+            conditions.append(f"A.source_id > {watermark}")
+
+        if upper is not None:
+            conditions.append(f"A.source_id <= {upper}")
+
+        conditions.append(Gaia._region_condition(region, extra_size))
+        query += ["WHERE", " AND ".join(conditions), "ORDER BY A.source_id ASC"]
+
+        return '\n'.join(query), temp_table_name, temp_table
+
+    @staticmethod
+    def _region_condition(region: Region, extra_size: float) -> str:
+        """
+        Compose the ADQL condition matching the Gaia DR2 sources inside the given region.
+
+        Args:
+            region (Region): The region that contains the stars to be downloaded.
+            extra_size (float): A positive number to extend the given region diameter.
 
+        Returns:
+            str: The condition over the A table alias.
+        """
         if hasattr(region, 'diam'):
-            radius = region.diam.to_value(u.degree) * extra_size / 2.0
-            query += f"""
-                1 = CONTAINS(
+            return Gaia._circle_condition.format(ra=region.ra_deg,
+                                                 dec=region.dec_deg,
+                                                 radius=region.diam_deg * extra_size / 2.0)
+
+        return Gaia._box_condition.format(ra=region.ra_deg,
+                                          dec=region.dec_deg,
+                                          width=region.width_deg * extra_size,
+                                          height=region.height_deg * extra_size)
+
+    def _compose_batch_query(self, regions: List[Region], extra_size: float,
+                             watermark: Union[Tuple[SourceID, int], None]) -> Tuple[str, str, Table]:
+        """
+        Compose the query to download data from Gaia DR2 for the given circular regions at once.
+
+        Regions are uploaded as a table and joined with the Gaia sources they contain,
+        so every row carries the region_index of its region in the given list.
+
+        Args:
+            regions (List[Region]): The regions that contain the stars to be downloaded.
+            extra_size (float): A positive number to extend the given regions diameter.
+            watermark (Union[Tuple[SourceID, int], None]): The (source_id, region_index) of the last downloaded row.
+
+        Returns:
+            Tuple[str, str, Table]: The download query, and the name and content of the table to upload.
+        """
+        regions_md5 = hashlib.md5('\n'.join(region.name for region in regions).encode('utf-8')).hexdigest()
+        temp_table_name = f"cdalvaro_{regions_md5}"
+        columns = [
+            np.arange(len(regions), dtype=np.int32),
+            [region.ra_deg for region in regions],
+            [region.dec_deg for region in regions],
+            [region.diam_deg * extra_size / 2.0 for region in regions],
+        ]
+        temp_table = Table(columns,
+                           names=['region_index', 'ra', 'dec', 'radius'],
+                           meta={'meta': f"temporary table for {len(regions)} regions"})
+
+        query = "SELECT" if Gaia.partition_size is None else f"SELECT TOP {Gaia.partition_size}"
+        query += f"""
+            {Gaia._select_columns}, B.region_index
+            {Gaia._from_table}
+            JOIN tap_upload.{temp_table_name} B
+                ON 1 = CONTAINS(
                     POINT('ICRS', A.ra, A.dec),
-                    CIRCLE('ICRS', {ra}, {dec}, {radius})
+                    CIRCLE('ICRS', B.ra, B.dec, B.radius)
                 )
-                """
-        else:
-            width = region.width.to_value(u.degree) * extra_size
-            height = region.height.to_value(u.degree) * extra_size
+            """
+
+        if watermark is not None:
+            source_id, region_index = watermark
             query += f"""
-                1 = CONTAINS(
-                    POINT('ICRS', A.ra, A.dec),
-                    BOX('ICRS',
-                        {ra}, {dec},
-                        {width}, {height})
-                )
+                WHERE A.source_id > {source_id}
+                OR (A.source_id = {source_id} AND B.region_index > {region_index})
                 """
 
         query += """
-            ORDER BY A.source_id ASC
+            ORDER BY A.source_id ASC, B.region_index ASC
             """
 
         return query, temp_table_name, temp_table
 
-    def _save_stars(self, region: Region, stars: Table):
+    def _save_stars(self, region: Region, stars: Table, raise_errors: bool = False):
         """
         Method for saving data into cdalvaro database.
 
         Args:
             region (Region): The region associated with to the data.
             stars (Table): An astropy table with the data to be saved.
+            raise_errors (bool, optional): Raise save errors after logging them. Defaults to False.
         """
         Gaia._logger.debug(f"Saving stars into db ...")
 
         try:
-            stars['priam_flags'] = stars['priam_flags'].astype(np.float64)
-            stars['flame_flags'] = stars['flame_flags'].astype(np.float64)
-            self.db.save_regions(set([region]))
-            self.db.save_stars(region=region, stars=stars.to_pandas())
+            # Regions already known by the DB (get_stars_source_id sets their serial) are not saved again
+            if region.serial is None:
+                self.db.save_regions(set([region]))
+            self.db.save_stars(region=region, stars=stars)
+        except Exception as error:
+            Gaia._logger.error(f"Error saving data for region {region}. Cause: {error}")
+            if raise_errors:
+                raise
+
+    def _save_stars_csv(self, region: Region, stars: str, raise_errors: bool = False):
+        """
+        Method for saving data from a CSV file into cdalvaro database.
+
+        The file is removed once it has been saved.
+
+        Args:
+            region (Region): The region associated with to the data.
+            stars (str): The CSV file with the data to be saved.
+            raise_errors (bool, optional): Raise save errors after logging them. Defaults to False.
+        """
+        Gaia._logger.debug(f"Saving stars from {stars} into db ...")
+
+        try:
+            if region.serial is None:
+                self.db.save_regions(set([region]))
+            with open(stars, 'rb') as file:
+                self.db.save_stars_csv(region=region, file=file)
         except Exception as error:
             Gaia._logger.error(f"Error saving data for region {region}. Cause: {error}")
+            if raise_errors:
+                raise
+        finally:
+            os.remove(stars)
+
+    @staticmethod
+    def _temporary_file() -> str:
+        """
+        Create an empty temporary CSV file for downloading results.
+
+        Returns:
+            str: The path of the file.
+        """
+        descriptor, path = tempfile.mkstemp(prefix='cdalvaro_', suffix='.csv')
+        os.close(descriptor)
+        return path
+
+    @staticmethod
+    def _csv_summary(path: str) -> Tuple[int, Union[SourceID, None]]:
+        """
+        Get the number of stars and the source_id of the last star of a CSV file downloaded from Gaia DR2.
+
+        Args:
+            path (str): The CSV file with a header line.
+
+        Returns:
+            Tuple[int, Union[SourceID, None]]: The number of stars and the last source_id, or None if there are no stars.
+        """
+        # Records are parsed with the csv module, since quoted fields may contain commas or line breaks
+        number_of_stars, last_star = 0, None
+        with open(path, newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            for star in reader:
+                if star:
+                    number_of_stars += 1
+                    last_star = star
+
+        if last_star is None:
+            return 0, None
+
+        return number_of_stars, int(last_star[[column.strip() for column in header].index('source_id')])
 
     def _login(self):
         """
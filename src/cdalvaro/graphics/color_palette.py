@@ -1,3 +1,5 @@
+import copy
+import functools
 import seaborn as sns
 
 
@@ -17,4 +19,17 @@ def color_palette(reverse: bool = False, **kwargs):
     if reverse:
         palette_name += '_r'
 
+    try:
+        palette = _color_palette(palette_name, **kwargs)
+    except TypeError:
+        # Unhashable arguments (e.g. lists) cannot be cached
+        return sns.color_palette(palette_name, **kwargs)
+
+    # Cached palettes and colormaps are mutable, so every caller gets its own copy
+    return copy.copy(palette)
+
+
+@functools.lru_cache(maxsize=None)
+def _color_palette(palette_name: str, **kwargs):
+    # seaborn builds a new palette on every call, so each combination of arguments is only built once
     return sns.color_palette(palette_name, **kwargs)
@@ -1,5 +1,6 @@
-from typing import Dict, Union
+from typing import Dict, Iterable, Union
 from matplotlib.axes import Axes
+from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
@@ -8,6 +9,7 @@ import seaborn as sns
 from .color_palette import color_palette
 
 N_SAMPLES = 4000
+N_RASTERIZED = 50_000
 
 
 def _resample_data(data: pd.DataFrame, n_samples: Union[int, None]) -> pd.DataFrame:
@@ -15,14 +17,41 @@ def _resample_data(data: pd.DataFrame, n_samples: Union[int, None]) -> pd.DataFr
         n_samples = N_SAMPLES
 
     if n_samples > 0 and data.shape[0] > n_samples:
-        return data.sample(n_samples, random_state=0)
+        # Drawing the positions with a NumPy Generator avoids the full permutation done by DataFrame.sample
+        # on large data sets. It is seeded with 0 like the previous DataFrame.sample(random_state=0) call,
+        # but it draws a different subsample, so plotted stars differ from figures made before this change.
+        positions = np.random.default_rng(0).choice(data.shape[0], n_samples, replace=False)
+        return data.take(positions)
     return data
 
 
+def _rasterized(data: pd.DataFrame) -> bool:
+    # Only very large scatter plots are embedded as images, since sampled ones are smaller as vector paths
+    return data.shape[0] > N_RASTERIZED
+
+
+def _subplots(ax: Axes = None, figsize: tuple = (6, 6)):
+    # Plots are drawn into the given axes, so several of them can share a single figure
+    if ax is None:
+        return plt.subplots(figsize=figsize, tight_layout=True)
+    return ax.figure, ax
+
+
+def _hue_levels(data: pd.DataFrame, hue: str) -> np.ndarray:
+    column = data[hue]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Categorical levels are read from their integer codes, so no label is compared nor sorted.
+        # Only the categories present in data are kept, in the order of the categories.
+        codes = column.cat.codes.to_numpy()
+        present = np.bincount(codes[codes >= 0], minlength=len(column.cat.categories)) > 0
+        return column.cat.categories.to_numpy()[present]
+    return np.sort(pd.unique(column))
+
+
 def _get_color_properties(data: pd.DataFrame, hue: str = None, **kwargs) -> dict:
     properties = dict()
     if hue is not None:
-        hue_order = np.sort(pd.unique(data[hue]))
+        hue_order = _hue_levels(data, hue)
         palette = color_palette(n_colors=len(hue_order), **kwargs)
 
         properties.update({'hue': hue, 'hue_order': hue_order, 'palette': palette})
@@ -43,7 +72,8 @@ def _set_axis_properties(ax: Axes,
                          yscale: str = None,
                          xscale: str = None,
                          legend: bool = False,
-                         legend_title: str = None):
+                         legend_title: str = None,
+                         legend_loc: str = 'best'):
 
     if title is not None:
         ax.set_title(title)
@@ -73,7 +103,9 @@ def _set_axis_properties(ax: Axes,
         ax.set_xscale(xscale)
 
     if legend and legend_title is not None:
-        _legend = ax.legend()
+        # The 'best' location is searched against every plotted point on each draw,
+        # so large scatter plots can be given a fixed location instead
+        _legend = ax.legend(loc=legend_loc)
         if _legend is not None:
             _legend.set_title(legend_title)
 
@@ -131,9 +163,11 @@ def plot_cluster_position(data: pd.DataFrame,
                           ylim: tuple = None,
                           hue: str = 'cluster_g',
                           legend: bool = True,
-                          n_samples: int = None):
+                          n_samples: int = None,
+                          legend_loc: str = 'best',
+                          ax: Axes = None):
 
-    fig, ax = plt.subplots(figsize=(6, 6), tight_layout=True)
+    fig, ax = _subplots(ax)
 
     data = _resample_data(data, n_samples)
     color_props = _get_color_properties(data, hue)
@@ -143,6 +177,7 @@ def plot_cluster_position(data: pd.DataFrame,
         x="ra",
         y="dec",
         s=12,
+        rasterized=_rasterized(data),
         ax=ax,
         legend=legend,
         **color_props,
@@ -155,7 +190,8 @@ def plot_cluster_position(data: pd.DataFrame,
                          xlim=xlim,
                          ylim=ylim,
                          legend=legend,
-                         legend_title='')
+                         legend_title='',
+                         legend_loc=legend_loc)
 
     return fig, ax, g
 
@@ -166,9 +202,11 @@ def plot_cluster_proper_motion(data: pd.DataFrame,
                                ylim: tuple = None,
                                hue: str = 'cluster_g',
                                legend: bool = True,
-                               n_samples: int = None):
+                               n_samples: int = None,
+                               legend_loc: str = 'best',
+                               ax: Axes = None):
 
-    fig, ax = plt.subplots(figsize=(6, 6), tight_layout=True)
+    fig, ax = _subplots(ax)
 
     data = _resample_data(data, n_samples)
     color_props = _get_color_properties(data, hue)
@@ -178,6 +216,7 @@ def plot_cluster_proper_motion(data: pd.DataFrame,
         x="pmra",
         y="pmdec",
         s=12,
+        rasterized=_rasterized(data),
         ax=ax,
         legend=legend,
         **color_props,
@@ -190,7 +229,8 @@ def plot_cluster_proper_motion(data: pd.DataFrame,
                          xlim=xlim,
                          ylim=ylim,
                          legend=legend,
-                         legend_title='')
+                         legend_title='',
+                         legend_loc=legend_loc)
 
     return fig, ax, g
 
@@ -203,9 +243,10 @@ def plot_cluster_parallax_histogram(data,
                                     bins='auto',
                                     hue: str = 'cluster_g',
                                     legend: bool = True,
-                                    n_samples: int = None):
+                                    n_samples: int = None,
+                                    ax: Axes = None):
 
-    fig, ax = plt.subplots(figsize=(6, 6), tight_layout=True)
+    fig, ax = _subplots(ax)
 
     data = _resample_data(data, n_samples)
     color_props = _get_color_properties(data, hue)
@@ -228,14 +269,23 @@ def plot_cluster_hr_diagram_curve(data: pd.DataFrame,
                                   ylim: tuple = None,
                                   hue: str = 'cluster_g',
                                   legend: bool = True,
-                                  n_samples: int = None):
+                                  n_samples: int = None,
+                                  legend_loc: str = 'best',
+                                  ax: Axes = None):
 
-    fig, ax = plt.subplots(figsize=(6, 6), tight_layout=True)
+    fig, ax = _subplots(ax)
 
     data = _resample_data(data, n_samples)
     color_props = _get_color_properties(data, hue)
 
-    g = sns.scatterplot(data=data, x="bp_rp", y="phot_g_mean_mag", s=12, ax=ax, legend=legend, **color_props)
+    g = sns.scatterplot(data=data,
+                        x="bp_rp",
+                        y="phot_g_mean_mag",
+                        s=12,
+                        rasterized=_rasterized(data),
+                        ax=ax,
+                        legend=legend,
+                        **color_props)
 
     _set_axis_properties(ax,
                          title=title,
@@ -245,27 +295,48 @@ def plot_cluster_hr_diagram_curve(data: pd.DataFrame,
                          ylim=ylim,
                          invert_yaxis=True,
                          legend=legend,
-                         legend_title='')
+                         legend_title='',
+                         legend_loc=legend_loc)
 
     return fig, ax, g
 
 
 def pairplot(data: pd.DataFrame, kind: str = 'scatter', n_samples: int = None):
 
-    data = _resample_data(data, n_samples).copy()
+    # assign adds the constant hue column to a new frame, so the given data is never modified
     hue = 'cluster_g'
-    data[hue] = 'g0'
+    data = _resample_data(data, n_samples).assign(**{hue: 'g0'})
 
     color_props = _get_color_properties(data, hue=hue)
 
-    g = sns.pairplot(data=data, kind=kind, **color_props)
+    plot_kws = {'rasterized': _rasterized(data)} if kind == 'scatter' else None
+    g = sns.pairplot(data=data, kind=kind, plot_kws=plot_kws, **color_props)
     g.legend.remove()
     g.tight_layout()
 
     return g
 
 
-def save_figure(fig, name: str, format: str = "pdf", save_dir='./', **kwargs):
+def save_figure(fig, name: str, format: str = "pdf", save_dir='./', close: bool = False, **kwargs):
     name = name.replace(' ', '_').lower()
     kwargs['format'] = format
+    if format in ('pdf', 'svg', 'eps'):
+        # Resolution of the rasterized artists inside vector figures
+        kwargs.setdefault('dpi', 150)
     fig.savefig(f"{save_dir}/{name}.{format}", **kwargs)
+
+    # Figures are kept by pyplot until they are closed
+    if close:
+        plt.close(fig)
+
+
+def save_figures(figs: Iterable, name: str, save_dir='./', close: bool = False, **kwargs):
+    name = name.replace(' ', '_').lower()
+    kwargs.setdefault('dpi', 150)
+
+    # Pages of a single PDF share their embedded fonts and metadata
+    with PdfPages(f"{save_dir}/{name}.pdf") as pdf:
+        for fig in figs:
+            pdf.savefig(fig, **kwargs)
+            if close:
+                plt.close(fig)
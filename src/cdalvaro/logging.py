@@ -1,28 +1,38 @@
 import logging
 import sys
+import threading
 
 
 class Logger():
 
     _logger: logging.Logger = None
+    _lock = threading.Lock()
 
     @staticmethod
     def instance() -> logging.Logger:
         if Logger._logger:
             return Logger._logger
 
-        Logger._logger = logging.getLogger('Gaia Downloader')
+        with Logger._lock:
+            # Another thread could have created the logger while waiting for the lock
+            if Logger._logger:
+                return Logger._logger
 
-        # Console handler
-        stderr_ch = logging.StreamHandler(stream=sys.stderr)
-        stderr_ch.setFormatter(CustomFormatter())
-        stderr_ch.addFilter(lambda record: record.levelno >= logging.WARNING)
-        Logger._logger.addHandler(stderr_ch)
+            logger = logging.getLogger('Gaia Downloader')
 
-        stdout_ch = logging.StreamHandler(stream=sys.stdout)
-        stdout_ch.setFormatter(CustomFormatter())
-        stdout_ch.addFilter(lambda record: record.levelno < logging.WARNING)
-        Logger._logger.addHandler(stdout_ch)
+            if not logger.handlers:
+                # Console handler
+                stderr_ch = logging.StreamHandler(stream=sys.stderr)
+                stderr_ch.setFormatter(CustomFormatter())
+                stderr_ch.addFilter(lambda record: record.levelno >= logging.WARNING)
+                logger.addHandler(stderr_ch)
+
+                stdout_ch = logging.StreamHandler(stream=sys.stdout)
+                stdout_ch.setFormatter(CustomFormatter())
+                stdout_ch.addFilter(lambda record: record.levelno < logging.WARNING)
+                logger.addHandler(stdout_ch)
+
+            Logger._logger = logger
 
         return Logger._logger
 
@@ -55,7 +65,14 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: _custom_format(color=ColorCodes.bold_red)
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._formatters = {
+            level: logging.Formatter(log_fmt, datefmt=CustomFormatter.datefmt)
+            for level, log_fmt in self.FORMATS.items()
+        }
+        self._default_formatter = logging.Formatter(datefmt=CustomFormatter.datefmt)
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self._formatters.get(record.levelno, self._default_formatter)
         return formatter.format(record)
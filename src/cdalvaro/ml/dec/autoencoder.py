@@ -8,7 +8,7 @@ KernelInitializer = TypeVar('KernelInitializer', bound=Union[str, Initializer])
 
 def autoencoder(dims: List[int],
                 activation: str = 'relu',
-                initializer: KernelInitializer = 'glorot_uniform') -> Tuple[Model, Model]:
+                initializer: KernelInitializer = None) -> Tuple[Model, Model]:
     """
     Fully connected symmetric autoencoder model.
 
@@ -16,13 +16,24 @@ def autoencoder(dims: List[int],
         dims (List[int]): List of the sizes of layers of encoder.
                           dims[0] is input dim, dims[-1] is size of the latent hidden layer.
         activation (str, optional): Activation function. Defaults to 'relu'.
-        initializer (KernelInitializer, optional): Kernel initializer. Defaults to 'glorot_uniform'.
+        initializer (KernelInitializer, optional): Kernel initializer. Defaults to None, which picks it by activation:
+                                                   'he_normal' for ReLU and ELU layers, 'lecun_normal' for SELU layers
+                                                   and 'glorot_uniform' for any other layer.
 
     Returns:
         Tuple[Model, Model]: Autoencoder and encoder models
     """
     n_stacks = len(dims) - 1
 
+    # He (LeCun for SELU) initialization keeps the variance of ReLU-like layers,
+    # so they converge faster than with Glorot.
+    # Linear layers (latent and output) use Glorot. An explicit initializer is used for every layer.
+    hidden_initializer = initializer
+    if initializer is None:
+        initializer = 'glorot_uniform'
+        hidden_initializers = {'relu': 'he_normal', 'elu': 'he_normal', 'selu': 'lecun_normal'}
+        hidden_initializer = hidden_initializers.get(activation, initializer)
+
     input_layer = Input(shape=(dims[0], ), name='input')
     layer = input_layer
 
@@ -30,7 +41,7 @@ def autoencoder(dims: List[int],
     for i_layer in range(n_stacks - 1):
         layer = Dense(dims[i_layer + 1],
                       activation=activation,
-                      kernel_initializer=initializer,
+                      kernel_initializer=hidden_initializer,
                       name=f"encoder_{i_layer}")(layer)
 
     # Latent hidden layer
@@ -39,7 +50,7 @@ def autoencoder(dims: List[int],
     # Decoder internal layers
     layer = encoded_layer
     for i_layer in range(n_stacks - 1, 0, -1):
-        layer = Dense(dims[i_layer], activation=activation, kernel_initializer=initializer,
+        layer = Dense(dims[i_layer], activation=activation, kernel_initializer=hidden_initializer,
                       name=f"decoder_{i_layer}")(layer)
 
     # Decoder output
@@ -59,9 +59,20 @@ class ClusteringLayer(Layer):
         Returns:
             Student's t-distribution, or soft labels for each sample. shape=(n_samples, n_clusters)
         """
-        q = 1.0 / (1.0 + (K.sum(K.square(K.expand_dims(inputs, axis=1) - self.clusters), axis=2) / self.alpha))
-        q = K.pow(q, (self.alpha + 1.0) / 2.0)
-        q = K.transpose(K.transpose(q) / K.sum(q, axis=1))
+        # ||x - µ||^2 = ||x||^2 + ||µ||^2 - 2 x·µ, so no (n_samples, n_clusters, n_features) tensor is built
+        distances = (K.sum(K.square(inputs), axis=1, keepdims=True) + K.sum(K.square(self.clusters), axis=1) -
+                     2.0 * K.dot(inputs, K.transpose(self.clusters)))
+        distances = K.maximum(distances, 0.0)
+
+        # alpha is a python number, so the division and the power are left out of the graph
+        # for the usual alpha = 1.0, where they do nothing
+        if self.alpha != 1.0:
+            distances = distances / self.alpha
+        q = 1.0 / (1.0 + distances)
+        exponent = (self.alpha + 1.0) / 2.0
+        if exponent != 1.0:
+            q = K.pow(q, exponent)
+        q = q / K.sum(q, axis=1, keepdims=True)
 
         return q
 
@@ -1,3 +1,4 @@
+import keras.backend as K
 from keras.models import Model
 from keras.optimizers import Adam, Optimizer, SGD
 import numpy as np
@@ -15,7 +16,7 @@ class DEC(object):
                  n_clusters: int,
                  activation: str = 'relu',
                  alpha: float = 1.0,
-                 initializer: KernelInitializer = 'glorot_uniform'):
+                 initializer: KernelInitializer = None):
         """
         Unsupervised Deep Embedding for Clustering Analysis (DEC)
         Link: http://proceedings.mlr.press/v48/xieb16.pdf
@@ -28,7 +29,7 @@ class DEC(object):
             n_clusters (int): The number of clusters to be found.
             activation (str, optional): Activation function used in encoder models. Defaults to relu.
             alpha (float, optional): Degrees of freedom of the Student's t-distribution. Defaults to 1.0.
-            initializer (KernelInitializer, optional): Kernel initializer used in encoder models. Defaults to glorot_uniform.
+            initializer (KernelInitializer, optional): Kernel initializer used in encoder models. Defaults to None (picked by activation).
             optimizer (Optimizer, optional): Optimizer used in encoder models. Defaults to SGD.
         """
         super(DEC, self).__init__()
@@ -73,8 +74,8 @@ class DEC(object):
         """
         self._model.load_weights(weights)
 
-    def extract_features(self, x):
-        return self._encoder.predict(x)
+    def extract_features(self, x, batch_size: int = 4096):
+        return self._encoder.predict(x, batch_size=batch_size)
 
     def pretrain(self,
                  x,
@@ -129,6 +130,7 @@ class DEC(object):
             maxiter: int = 2000,
             tol: float = 1e-3,
             update_interval: int = 140,
+            predict_batch_size: int = 4096,
             save_dir: str = None,
             verbose: int = 1):
         """
@@ -140,6 +142,7 @@ class DEC(object):
             maxiter (int, optional): Maximum iterations for training. Defaults to 1000.
             tol (float, optional): Tolerance threshold to stop training. Defaults to 1e-3.
             update_interval (int, optional): Number of iterations before updating internal predictions. Defaults to 140.
+            predict_batch_size (int, optional): The batch size used to predict the whole dataset. Defaults to 4096.
             save_dir (str, optional): The directory for saving dec model weights. Defaults to None.
             verbose (int, optional): The verbosity level. Defaults to 1.
 
@@ -149,38 +152,45 @@ class DEC(object):
         if verbose > 0:
             print("Training DEC model...")
 
+        # Samples are converted to the keras float type once, instead of converting every batch and prediction
+        x = np.asarray(x, dtype=K.floatx())
+
         # DEC - Phase 1: parameter initialization with a deep autoencoder
         # Reference:
         #     Unsupervised Deep Embedding for Clustering Analysis - 3.2 Parameter initialization
         kmeans = KMeans(self._n_clusters, n_init=20)
-        y_pred = kmeans.fit_predict(self._encoder.predict(x))
-        y_pred_last = np.copy(y_pred)
+        # The whole dataset is predicted with large batches, since keras predict defaults to batches of 32 samples
+        y_pred_last = kmeans.fit_predict(self._encoder.predict(x, batch_size=predict_batch_size)).astype(np.intp)
+        # Predictions are written into the same buffers on every update instead of allocating new arrays
+        y_pred = np.empty_like(y_pred_last)
         self._model.get_layer(name='clustering').set_weights([kmeans.cluster_centers_])
 
         # DEC - Phase 2: Optimization
         # Reference:
         #     Unsupervised Deep Embedding for Clustering Analysis - 3.1 Clustering with KL divergence
         loss, index = 1.0, 0
-        index_array, p = np.arange(x.shape[0]), []
+        # The target distribution is recomputed into the same buffer on every update
+        p = np.empty((x.shape[0], self._n_clusters), dtype=K.floatx())
         for it in range(maxiter):
             if it % update_interval == 0:
                 if verbose > 0:
                     print(f"Iteration {it + 1}/{maxiter} - loss: {np.max(loss):.4e}")
-                q = self._model.predict(x, verbose=verbose)
-                p = self._target_distribution(q)
-                y_pred = np.argmax(q, 1)
+                q = self._model.predict(x, batch_size=predict_batch_size, verbose=verbose)
+                self._target_distribution(q, out=p)
+                np.argmax(q, axis=1, out=y_pred)
 
                 # Stop criteria
-                delta_label = np.sum(y_pred != y_pred_last, dtype=np.float32) / y_pred.shape[0]
-                y_pred_last = np.copy(y_pred)
+                delta_label = np.count_nonzero(y_pred != y_pred_last) / y_pred.shape[0]
+                np.copyto(y_pred_last, y_pred)
                 if it > 0 and delta_label < tol:
                     if verbose > 0:
                         print(f"Reached tolerance threshold: {delta_label:.4e} < {tol}. Stopping training.")
                     break
 
             # Train on batch
-            idx = index_array[index * batch_size:min((index + 1) * batch_size, x.shape[0])]
-            loss = self._model.train_on_batch(x=x[idx], y=p[idx])
+            # Batches are contiguous, so they are taken as slices (views) instead of copying them with an index array
+            start, stop = index * batch_size, min((index + 1) * batch_size, x.shape[0])
+            loss = self._model.train_on_batch(x=x[start:stop], y=p[start:stop])
             index = index + 1 if (index + 1) * batch_size <= x.shape[0] else 0
 
         self._trained = True
@@ -191,31 +201,36 @@ class DEC(object):
             self._autoencoder.save_weights(file_path)
             print(f"DEC model weights have been saved to: {file_path}")
 
-    def predict(self, x, verbose: int = 0) -> np.ndarray:
+    def predict(self, x, batch_size: int = 4096, verbose: int = 0) -> np.ndarray:
         """
         Generate predictions for the given dataset
 
         Args:
             x: The input data
+            batch_size (int, optional): The batch size used for predicting. Defaults to 4096.
 
         Returns:
             np.ndarray: Numpy array of predictions
         """
         if not self._trained:
             raise Exception("This model has not been trained yet")
-        q = self._model.predict(x, verbose=verbose)
+        q = self._model.predict(x, batch_size=batch_size, verbose=verbose)
         return np.argmax(q, 1)
 
     @staticmethod
-    def _target_distribution(q: np.ndarray) -> np.ndarray:
+    def _target_distribution(q: np.ndarray, out: np.ndarray = None) -> np.ndarray:
         """
         Kullback-Leibler (KL) divergence
 
         Args:
             q (np.ndarray): Model predictions
+            out (np.ndarray, optional): Buffer where the distribution is stored. Defaults to None.
 
         Returns:
             np.ndarray: The computed distribution
         """
-        weight = q**2 / q.sum(0)
-        return (weight.T / weight.sum(1)).T
+        # Operations are done in place over a single buffer, without transposing it
+        weight = np.square(q, out=out)
+        weight /= q.sum(axis=0)
+        weight /= weight.sum(axis=1, keepdims=True)
+        return weight
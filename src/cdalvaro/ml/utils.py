@@ -1,53 +1,132 @@
+from joblib import delayed, Parallel
+import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
-from typing import List, Tuple
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import calinski_harabasz_score, pairwise_distances, silhouette_score
+from typing import List, Tuple, Type, Union
+
+# Maximum size in bytes of the precomputed silhouette distance matrix
+SILHOUETTE_DISTANCES_BUDGET = 1 << 30
 
 
 def estimate_n_clusters(x,
                         metric: str = 'euclidean',
                         min_clusters: int = 2,
                         max_clusters: int = 10,
+                        sample_size: int = None,
+                        n_jobs: int = None,
+                        score: str = 'silhouette',
+                        estimator: Type[Union[KMeans, MiniBatchKMeans]] = KMeans,
                         verbose: bool = False) -> Tuple[int, KMeans]:
     """
-    Estimate the number of clusters based on silhoutte score.
+    Estimate the number of clusters based on silhoutte score (or Calinski-Harabasz score).
 
     Args:
         x (array-like): Data to be fit for best number of clusters estimation.
         metric (str, optional): The metric to use when calculating distance between instances in a feature array. Defaults to euclidean.
         min_clusters (int, optional): The minimum number fo clusters to be tested. Defaults to 2.
         max_clusters (int, optional): The maximum number of clusters to be tested. Defaults to 10.
+        sample_size (int, optional): The number of samples used to compute the silhouette score.
+            Large datasets can be scored over a sample, since the score is quadratic in the number of samples. Defaults to None (all of them).
+        n_jobs (int, optional): The number of jobs used to test the numbers of clusters in parallel. Defaults to None (sequential).
+        score (str, optional): The score to be maximized, either silhouette or calinski_harabasz. Calinski-Harabasz is linear in the number of samples,
+            so it does not need any pairwise distance. Defaults to silhouette.
+        estimator (Type[Union[KMeans, MiniBatchKMeans]], optional): The class used to fit the tested numbers of clusters.
+            When MiniBatchKMeans is used, the returned model is refitted with KMeans for the estimated number of clusters. Defaults to KMeans.
         verbose (bool, optional): Show algorithm progress. Defaults to False.
 
     Raises:
-        ValueError: If the number of clusters cannot be estimated.
+        ValueError: If the score is not supported or the number of clusters cannot be estimated.
 
     Returns:
         int: The estimated number of clusters
     """
+    if score not in ('silhouette', 'calinski_harabasz'):
+        raise ValueError(f"Unsupported score: {score}")
+
+    # When sample_size is given, data is scored over a fixed sample (the same one silhouette_score draws with random_state=0)
+    x = np.asarray(x)
+    if sample_size is None or sample_size >= x.shape[0]:
+        sample = np.arange(x.shape[0])
+    else:
+        sample = np.random.RandomState(0).permutation(x.shape[0])[:sample_size]
+
+    # Distances between the scored samples do not depend on the number of clusters, so they are computed only once.
+    # Larger samples fall back to silhouette_score, which computes them in chunks for every number of clusters.
+    # (pairwise_distances keeps single precision data in float32, halving the matrix size)
+    distances = None
+    itemsize = np.dtype(np.float32 if x.dtype == np.float32 else np.float64).itemsize
+    if score == 'silhouette' and sample.shape[0]**2 * itemsize <= SILHOUETTE_DISTANCES_BUDGET:
+        distances = pairwise_distances(x[sample], metric=metric)
+
+    results = Parallel(n_jobs=n_jobs)(delayed(_fit_and_score)(x, n_clusters, estimator, score, metric, distances, sample)
+                                      for n_clusters in range(min_clusters, max_clusters + 1))
+
+    score_name = 'Silhouette' if score == 'silhouette' else 'Calinski-Harabasz'
     best_score = -1.0
     best_n_clusters: int = None
     best_kmeans: KMeans = None
-    for n_clusters in range(min_clusters, max_clusters + 1):
-        kmeans = KMeans(n_clusters=n_clusters)
-        pred = kmeans.fit_predict(x)
-        score = silhouette_score(x, pred, metric=metric)
+    for n_clusters, kmeans, n_clusters_score in results:
         if verbose:
-            print(f"Silhouette score for {n_clusters} clusters: {score:.4f}")
-        if score > best_score:
-            best_score = score
+            print(f"{score_name} score for {n_clusters} clusters: {n_clusters_score:.4f}")
+        if n_clusters_score > best_score:
+            best_score = n_clusters_score
             best_n_clusters = n_clusters
             best_kmeans = kmeans
 
     if best_n_clusters is None:
         raise ValueError("Unable to estimate the number of clusters to be used")
 
+    # Mini-batch models are only used to compare the numbers of clusters
+    # (MiniBatchKMeans subclasses KMeans in older scikit-learn versions, so it is checked explicitly)
+    if isinstance(best_kmeans, MiniBatchKMeans):
+        best_kmeans = KMeans(n_clusters=best_n_clusters).fit(x)
+
     if verbose:
-        print(f"Best silhouette score is {best_score:.4f} for {best_n_clusters} clusters")
+        print(f"Best {score_name.lower()} score is {best_score:.4f} for {best_n_clusters} clusters")
 
     return best_n_clusters, best_kmeans
 
 
+def _fit_and_score(x, n_clusters: int, estimator: Type[Union[KMeans, MiniBatchKMeans]], score: str, metric: str,
+                   distances: np.ndarray, sample: np.ndarray) -> Tuple[int, Union[KMeans, MiniBatchKMeans], float]:
+    kmeans = estimator(n_clusters=n_clusters)
+    pred = kmeans.fit_predict(x)
+    if score == 'calinski_harabasz':
+        score = calinski_harabasz_score(x, pred)
+    elif distances is None:
+        score = silhouette_score(x[sample], pred[sample], metric=metric)
+    else:
+        score = _silhouette_score(distances, pred[sample])
+    return n_clusters, kmeans, score
+
+
+def _silhouette_score(distances: np.ndarray, labels: np.ndarray) -> float:
+    # Same score as silhouette_score with metric='precomputed', but the distance sums to every cluster
+    # are obtained for all samples at once with a single matrix product instead of a loop over the samples
+    clusters, labels = np.unique(labels, return_inverse=True)
+    n_samples, n_clusters = labels.shape[0], clusters.shape[0]
+    if not 1 < n_clusters < n_samples:
+        raise ValueError(f"Number of labels is {n_clusters}. Valid values are 2 to n_samples - 1 (inclusive)")
+
+    samples = np.arange(n_samples)
+    membership = np.zeros((n_samples, n_clusters), dtype=distances.dtype)
+    membership[samples, labels] = 1.0
+    cluster_sizes = np.bincount(labels)
+    cluster_distances = distances @ membership
+
+    # Mean distance to the other members of its cluster, and to the members of the nearest cluster
+    intra = cluster_distances[samples, labels] / np.maximum(cluster_sizes[labels] - 1, 1)
+    cluster_distances[samples, labels] = np.inf
+    inter = np.min(cluster_distances / cluster_sizes, axis=1)
+
+    with np.errstate(invalid='ignore'):
+        scores = (inter - intra) / np.maximum(intra, inter)
+    # Samples alone in their cluster score 0
+    scores[cluster_sizes[labels] == 1] = 0.0
+    return float(np.mean(np.nan_to_num(scores)))
+
+
 def filter_outliers(df: pd.DataFrame, q: float = 0.05) -> pd.Series:
     """
     Return a mask indicating those entries inside the specified quantile `q`.
@@ -59,10 +138,14 @@ def filter_outliers(df: pd.DataFrame, q: float = 0.05) -> pd.Series:
     Returns:
         pd.Series: A series indicating those entries inside the quantiles.
     """
-    upper = df.quantile(1.0 - q)
-    lower = df.quantile(q)
-    mask = (df < upper) & (df > lower)
-    return mask
+    # Both quantiles are computed in a single pass over the raw values (NaN are ignored, as in DataFrame.quantile)
+    values = df.to_numpy(dtype=float)
+    lower, upper = np.nanquantile(values, [q, 1.0 - q], axis=0)
+    mask = (values < upper) & (values > lower)
+
+    if isinstance(df, pd.Series):
+        return pd.Series(mask, index=df.index, name=df.name)
+    return pd.DataFrame(mask, index=df.index, columns=df.columns)
 
 
 def cluster_centers(df: pd.DataFrame, key: str, columns: List[str] = []) -> pd.DataFrame:
@@ -77,11 +160,7 @@ def cluster_centers(df: pd.DataFrame, key: str, columns: List[str] = []) -> pd.D
     Returns:
         pd.DataFrame: A DataFrame with center for each cluster and column.
     """
-    if len(columns) > 0 and key not in columns:
-        columns.append(key)
-    __df = df[columns] if len(columns) > 0 else df
-
-    return __df.groupby(by=key).mean()
+    return _group_columns(df, key, columns).mean()
 
 
 def cluster_stats(df: pd.DataFrame, key: str, columns: List[str] = [], **kwargs) -> pd.DataFrame:
@@ -98,8 +177,11 @@ def cluster_stats(df: pd.DataFrame, key: str, columns: List[str] = [], **kwargs)
     Returns:
         pd.DataFrame: A DataFrame with statistics for each cluster and column.
     """
-    if len(columns) > 0 and key not in columns:
-        columns.append(key)
-    __df = df[columns] if len(columns) > 0 else df
+    return _group_columns(df, key, columns).describe(**kwargs)
+
 
-    return __df.groupby(by=key).describe(**kwargs)
+def _group_columns(df: pd.DataFrame, key: str, columns: List[str]):
+    # Columns are selected on the groupby object, so neither the DataFrame nor the caller's list are copied or modified
+    grouped = df.groupby(by=key)
+    columns = [column for column in columns if column != key]
+    return grouped[columns] if len(columns) > 0 else grouped
@@ -32,9 +32,9 @@ class OpenCluster(Region):
 
     def __iter__(self):
         yield 'name', self.name
-        yield 'ra', self.coords.ra.degree
-        yield 'dec', self.coords.dec.degree
-        yield 'diam', self.diam.to_value(u.degree)
+        yield 'ra', self.ra_deg
+        yield 'dec', self.dec_deg
+        yield 'diam', self.diam_deg
         yield 'trumpler', self.trumpler
         yield 'g1_class', self.g1_class
         yield 'number_of_cluster_members', self.number_of_cluster_members
@@ -1,5 +1,8 @@
-from astropy.coordinates import SkyCoord
+from astropy.coordinates import Angle, SkyCoord
+import astropy.units as u
 from astropy.units import Quantity
+from functools import cached_property
+from typing import Tuple
 
 
 class Region:
@@ -45,6 +48,51 @@ class Region:
         self.name = name
         self.coords = coords
         self.serial = serial
+        self._hash = hash(name)
+
+    @cached_property
+    def ra_deg(self) -> float:
+        """
+        float: The right ascension of the region in degrees.
+        """
+        return float(self._lon_lat[0].degree)
+
+    @cached_property
+    def dec_deg(self) -> float:
+        """
+        float: The declination of the region in degrees.
+        """
+        return float(self._lon_lat[1].degree)
+
+    @property
+    def _lon_lat(self) -> Tuple[Angle, Angle]:
+        # Reading the stored spherical representation is much faster than going through
+        # the frame machinery of coords.ra and coords.dec, which gives the same values for ICRS coordinates
+        data = self.coords.data
+        if self.coords.frame.name == 'icrs' and hasattr(data, 'lon') and hasattr(data, 'lat'):
+            return data.lon, data.lat
+        return self.coords.ra, self.coords.dec
+
+    @cached_property
+    def diam_deg(self) -> float:
+        """
+        float: The diameter of the region in degrees.
+        """
+        return float(self.diam.to_value(u.degree))
+
+    @cached_property
+    def width_deg(self) -> float:
+        """
+        float: The width of the region in degrees.
+        """
+        return float(self.width.to_value(u.degree))
+
+    @cached_property
+    def height_deg(self) -> float:
+        """
+        float: The height of the region in degrees.
+        """
+        return float(self.height.to_value(u.degree))
 
     def __str__(self) -> str:
         return self.name
@@ -58,4 +106,14 @@ class Region:
         return self.name == f"{other}"
 
     def __hash__(self) -> int:
-        return hash(self.name)
+        return self._hash
+
+    def __getstate__(self) -> dict:
+        # String hashes change between processes, so the hash is computed again when unpickling
+        state = self.__dict__.copy()
+        state.pop('_hash', None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._hash = hash(self.name)
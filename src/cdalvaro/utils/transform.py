@@ -1,42 +1,29 @@
+import numpy as np
 import pandas as pd
 from typing import List
 
 
 def binarize(data: pd.DataFrame, bins: List[float], by: str, norm_by: str = None) -> pd.DataFrame:
-    bins_it = iter(bins)
-    min_cut = next(bins_it)
-
-    _data = list()
-    grouped_data = list()
-
     desc = 'desc'
     keys = pd.unique(data[desc])
 
-    # First bin
-    _data = data[data[by] < min_cut].groupby(by=desc).sum()
-    for key in keys:
-        value = _data.loc[key]['value'] if _data.shape[0] > 0 else 0
-        if norm_by is not None and key != norm_by:
-            value /= _data.loc[norm_by]['value']
-        grouped_data.append({by: f'$<{min_cut}$', 'value': value, 'desc': key})
-
-    # Middle bins
-    for max_cut in bins_it:
-        _data = data[(data[by] >= min_cut) & (data[by] < max_cut)].groupby(by=desc).sum()
-        for key in keys:
-            value = _data.loc[key]['value'] if _data.shape[0] > 0 else 0
-            if norm_by is not None and key != norm_by:
-                value /= _data.loc[norm_by]['value']
-            grouped_data.append({by: f'${min_cut}-{max_cut}$', 'value': value, 'desc': key})
-
-        min_cut = max_cut
-
-    # Last bin
-    _data = data[data[by] >= min_cut].groupby(by=desc).sum()
-    for key in keys:
-        value = _data.loc[key]['value'] if _data.shape[0] > 0 else 0
-        if norm_by is not None and key != norm_by:
-            value /= _data.loc[norm_by]['value']
-        grouped_data.append({by: f'$\geq{min_cut}$', 'value': value, 'desc': key})
-
-    return pd.DataFrame(grouped_data)
+    labels = [f'$<{bins[0]}$']
+    labels += [f'${min_cut}-{max_cut}$' for min_cut, max_cut in zip(bins[:-1], bins[1:])]
+    labels += [f'$\\geq{bins[-1]}$']
+
+    # Every row is assigned to its bin at once, and values are summed by bin and key in a single groupby
+    edges = [-np.inf, *bins, np.inf]
+    binned = pd.cut(data[by], edges, labels=labels, right=False)
+    values = data['value'].groupby([binned, data[desc]], observed=False).sum().unstack(fill_value=0)
+    values = values.reindex(index=labels, columns=keys, fill_value=0)
+
+    if norm_by is not None:
+        norm_values = values[norm_by]
+        values = values.div(norm_values, axis=0)
+        values[norm_by] = norm_values
+
+    return pd.DataFrame({
+        by: np.repeat(labels, len(keys)),
+        'value': values.to_numpy().ravel(),
+        desc: np.tile(keys, len(labels)),
+    })
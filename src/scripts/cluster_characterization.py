@@ -5,7 +5,7 @@ from cdalvaro.data_base import DB
 from cdalvaro.graphics import plot as cplt
 from cdalvaro.logging import Logger
 from cdalvaro.ml import DEC
-from cdalvaro.ml.utils import estimate_n_clusters, filter_outliers
+from cdalvaro.ml.utils import estimate_n_clusters
 from IPython.display import Image
 import logging
 import numpy as np
@@ -45,7 +45,7 @@ variables = [
     "phot_g_mean_mag", "bp_rp"
 ]
 
-non_null_columns = list(filter(lambda x: not re.search(r'_error', x), variables))
+non_null_columns = [variable for variable in variables if not re.search(r'_error', variable)]
 
 # Stars selection
 stars_df = db.get_stars(region=cluster, columns=variables, filter_null_columns=non_null_columns)
@@ -54,11 +54,14 @@ stars_df = stars_df[(np.abs(stars_df['pmra']) > 0.0)
                     & (np.abs(stars_df['pmdec']) > 0.0)
                     & (np.abs(stars_df['parallax']) > 0.0)]
 
-stars_df['pmra_corr'] = stars_df['pmra'] * 1000.0 / stars_df['parallax']
-stars_df['pmdec_corr'] = stars_df['pmdec'] * 1000.0 / stars_df['parallax']
+# Features are computed over the raw arrays, sharing the parallax correction and without squared intermediates
+pmra, pmdec = stars_df['pmra'].to_numpy(), stars_df['pmdec'].to_numpy()
+distance = 1000.0 / stars_df['parallax'].to_numpy()
+stars_df['pmra_corr'] = pmra_corr = pmra * distance
+stars_df['pmdec_corr'] = pmdec_corr = pmdec * distance
 
-stars_df['pmmod'] = np.sqrt(stars_df['pmra_corr'] ** 2 + stars_df['pmdec_corr'] ** 2)
-stars_df['pmang'] = np.arctan2(stars_df['pmdec_corr'], stars_df['pmra_corr'])
+stars_df['pmmod'] = np.hypot(pmra_corr, pmdec_corr)
+stars_df['pmang'] = np.arctan2(pmdec_corr, pmra_corr)
 
 stars_df.head()
 
@@ -67,22 +70,27 @@ features = ['pmra_corr', 'pmdec_corr', 'pmmod', 'parallax']
 
 ## Feature rescaling
 scaler = MinMaxScaler()
-x = scaler.fit_transform(stars_df[features])
+# KMeans and DEC work in single precision, so features are scaled as float32 instead of float64
+x = scaler.fit_transform(stars_df[features].to_numpy(dtype=np.float32))
 
 # K-Means
 
 ## Step 1 - Creating and training K-means model
-n_clusters, kmeans = estimate_n_clusters(x, min_clusters=3, max_clusters=10, verbose=True)
-stars_df['cluster_g'] = np.array([f"g{g}" for g in kmeans.predict(x)], dtype=str)
+n_clusters, kmeans = estimate_n_clusters(x, min_clusters=3, max_clusters=10, sample_size=10_000, verbose=True)
+
+# Cluster labels are stored as categories, so they are not formatted per star
+# and plots get the groups from the category codes instead of comparing strings
+cluster_labels = [f"g{g}" for g in range(n_clusters)]
+stars_df['cluster_g'] = pd.Categorical.from_codes(kmeans.predict(x), categories=cluster_labels)
 
 fig, ax, g = cplt.plot_cluster_proper_motion(stars_df, xlim=(-30, 50), ylim=(-70, 40))
-cplt.save_figure(fig, name=f"kmeans_pm_{cluster.name}", save_dir=figures_path)
+cplt.save_figure(fig, name=f"kmeans_pm_{cluster.name}", save_dir=figures_path, close=True)
 
 fig, ax, g = cplt.plot_cluster_parallax_histogram(stars_df, xlim=(-4, 10), stat='density')
-cplt.save_figure(fig, name=f"kmeans_parallax_{cluster.name}", save_dir=figures_path)
+cplt.save_figure(fig, name=f"kmeans_parallax_{cluster.name}", save_dir=figures_path, close=True)
 
-fig, ax, g = cplt.plot_cluster_isochrone_curve(stars_df, xlim=(-1, 4), ylim=(3, 21))
-cplt.save_figure(fig, name=f"kmeans_isochrone_{cluster.name}", save_dir=figures_path)
+fig, ax, g = cplt.plot_cluster_hr_diagram_curve(stars_df, xlim=(-1, 4), ylim=(3, 21))
+cplt.save_figure(fig, name=f"kmeans_isochrone_{cluster.name}", save_dir=figures_path, close=True)
 
 stars_df['cluster_g'].value_counts()
 
@@ -117,33 +125,31 @@ verbose = 1
 dec.pretrain(x, optimizer=optimizer, epochs=epochs, batch_size=batch_size)
 dec.fit(x, batch_size=batch_size, maxiter=maxiter, update_interval=update_interval, verbose=verbose)
 
-stars_df['cluster_g'] = np.array([f"g{g}" for g in dec.predict(x)], dtype=str)
+stars_df['cluster_g'] = pd.Categorical.from_codes(dec.predict(x), categories=cluster_labels)
 stars_df['cluster_g'].value_counts()
 
 fig, ax, g = cplt.plot_cluster_proper_motion(stars_df, xlim=(-30, 50), ylim=(-70, 40))
-cplt.save_figure(fig, name=f"dec_pm_{cluster.name}", save_dir=figures_path)
+cplt.save_figure(fig, name=f"dec_pm_{cluster.name}", save_dir=figures_path, close=True)
 
 fig, ax, g = cplt.plot_cluster_parallax_histogram(stars_df, xlim=(-4, 10), stat='density')
-cplt.save_figure(fig, name=f"dec_parallax_{cluster.name}", save_dir=figures_path)
+cplt.save_figure(fig, name=f"dec_parallax_{cluster.name}", save_dir=figures_path, close=True)
 
-fig, ax, g = cplt.plot_cluster_isochrone_curve(stars_df, xlim=(-1, 4), ylim=(3, 21))
-cplt.save_figure(fig, name=f"dec_isochrone_{cluster.name}", save_dir=figures_path)
+fig, ax, g = cplt.plot_cluster_hr_diagram_curve(stars_df, xlim=(-1, 4), ylim=(3, 21))
+cplt.save_figure(fig, name=f"dec_isochrone_{cluster.name}", save_dir=figures_path, close=True)
 
-filtered_df = None
+# Both parallax quantiles of each group are computed in a single groupby (one row per category, in code order)
+# and broadcast to its stars through the categorical codes, so all groups are filtered at once
 q = 0.25
-for i in [f"g{x}" for x in range(n_clusters)]:
-    df = stars_df[stars_df['cluster_g'] == i]
-    mask = filter_outliers(df['parallax'], q)
-    if filtered_df is None:
-        filtered_df = df[mask]
-    else:
-        filtered_df = pd.concat([filtered_df, df[mask]])
+bounds = stars_df.groupby('cluster_g', observed=False)['parallax'].quantile([q, 1.0 - q]).unstack()
+lower, upper = bounds.to_numpy()[stars_df['cluster_g'].cat.codes.to_numpy()].T
+parallax = stars_df['parallax'].to_numpy()
+filtered_df = stars_df[(parallax > lower) & (parallax < upper)]
 
 fig, ax, g = cplt.plot_cluster_proper_motion(filtered_df, xlim=(-30, 50), ylim=(-70, 40))
-cplt.save_figure(fig, name=f"dec_pm_{cluster.name}_filtered", save_dir=figures_path)
+cplt.save_figure(fig, name=f"dec_pm_{cluster.name}_filtered", save_dir=figures_path, close=True)
 
 fig, ax, g = cplt.plot_cluster_parallax_histogram(filtered_df, xlim=(-4, 10), stat='density')
-cplt.save_figure(fig, name=f"dec_parallax_{cluster.name}_filtered", save_dir=figures_path)
+cplt.save_figure(fig, name=f"dec_parallax_{cluster.name}_filtered", save_dir=figures_path, close=True)
 
-fig, ax, g = cplt.plot_cluster_isochrone_curve(filtered_df, xlim=(-1, 4), ylim=(3, 21))
-cplt.save_figure(fig, name=f"dec_isochrone_{cluster.name}_filtered", save_dir=figures_path)
+fig, ax, g = cplt.plot_cluster_hr_diagram_curve(filtered_df, xlim=(-1, 4), ylim=(3, 21))
+cplt.save_figure(fig, name=f"dec_isochrone_{cluster.name}_filtered", save_dir=figures_path, close=True)
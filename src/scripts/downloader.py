@@ -8,6 +8,14 @@ import logging
 import numpy as np
 import os
 
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
 parser = argparse.ArgumentParser(prog='Gaia DR2 Downloader', description='✨ Stars downloader from the GAIA DR2 dataset')
 parser.add_argument('--cluster',
                     '-c',
@@ -22,7 +30,7 @@ parser.add_argument('--exclude',
                     '-e',
                     nargs='*',
                     type=str,
-                    default={},
+                    default=[],
                     help="""
         Clusters to be ignored from the download. Default to empty.
         """)
@@ -35,6 +43,14 @@ parser.add_argument('--extra-size',
         Extra size to extend regions to be downloaded.
         Default to 1.5.
         """)
+parser.add_argument('--jobs',
+                    '-j',
+                    type=positive_int,
+                    default=None,
+                    help="""
+        Number of regions to be downloaded concurrently.
+        Default to GAIA_WORKERS environment variable or 4.
+        """)
 
 update_data_parser = parser.add_mutually_exclusive_group(required=False)
 update_data_parser.add_argument('--update-data',
@@ -47,6 +63,31 @@ update_data_parser.add_argument('--update-data',
 update_data_parser.add_argument('--no-update-data', dest='update_data', action='store_false')
 update_data_parser.set_defaults(update_data=True)
 
+stream_results_parser = parser.add_mutually_exclusive_group(required=False)
+stream_results_parser.add_argument('--stream-results',
+                                   dest='stream_results',
+                                   action='store_true',
+                                   help="""
+        Download stars as CSV files and copy them straight into the database
+        instead of parsing them into astropy tables.
+        """)
+stream_results_parser.add_argument('--no-stream-results',
+                                   dest='stream_results',
+                                   action='store_false',
+                                   help="""
+        Parse downloaded stars into astropy tables before saving them. Default.
+        """)
+stream_results_parser.set_defaults(stream_results=False)
+
+parser.add_argument('--incremental',
+                    '-i',
+                    action='store_true',
+                    help="""
+        Resume each region from the greatest source_id already saved instead of
+        excluding every saved star. Regions must be downloaded with the same extra size
+        and GAIA_RANGE_JOBS must be 1.
+        """)
+
 parser.add_argument('--verbose', '-v', action='count', default=0)
 
 args = parser.parse_args()
@@ -68,14 +109,15 @@ if len(args.cluster) == 1 and 'ALL' in args.cluster:
 else:
     clusters = set()
     for cluster_name in args.cluster:
-        if cluster_name in catalogue.keys():
-            clusters.add(catalogue[cluster_name])
-        else:
+        cluster = catalogue.get(cluster_name)
+        if cluster is None:
             logger.error(f"Cluster '{cluster_name}' is not avaiable at the OpenClust catalogue")
             exit(1)
+        clusters.add(cluster)
 
 if len(args.exclude) > 0:
-    clusters = set(filter(lambda x: x not in args.exclude, clusters))
+    # Regions are hashed and compared by name, so they can be subtracted directly from a set of names
+    clusters -= frozenset(args.exclude)
 
 db_host = os.getenv('DB_HOST', 'localhost')
 db_port = os.getenv('DB_PORT', 5432)
@@ -83,8 +125,7 @@ db = DB.instance(host=db_host, port=db_port)
 
 if not args.update_data:
     logger.info("Existing regions won't be updated")
-    existing_clusters = db.get_regions().keys()
-    clusters = set(filter(lambda x: x not in existing_clusters, clusters))
+    clusters -= frozenset(db.get_regions().keys())
 
 if len(clusters) == 0:
     logger.info("🍻 All regions are already downloaded")
@@ -94,9 +135,17 @@ gaia_username = os.getenv('GAIA_USER', None)
 gaia_password = os.getenv('GAIA_PASS', None)
 
 Gaia.partition_size = np.int32(os.getenv('GAIA_PARTITION_SIZE', 500_000))
+Gaia.max_workers = int(os.getenv('GAIA_WORKERS', Gaia.max_workers)) if args.jobs is None else args.jobs
+Gaia.max_jobs = int(os.getenv('GAIA_MAX_JOBS', Gaia.max_jobs))
+Gaia.batch_size = int(os.getenv('GAIA_BATCH_SIZE', Gaia.batch_size))
+Gaia.range_jobs = int(os.getenv('GAIA_RANGE_JOBS', Gaia.range_jobs))
+Gaia.stream_results = args.stream_results
+
+if args.incremental and Gaia.range_jobs > 1:
+    parser.error("--incremental requires GAIA_RANGE_JOBS to be 1")
 
 gaia = Gaia(db=db, username=gaia_username, password=gaia_password)
-gaia.download_and_save(regions=clusters, extra_size=args.extra_size)
+gaia.download_and_save(regions=clusters, extra_size=args.extra_size, incremental=args.incremental)
 
 logger.info("🚀 Gaia downloader has finished retrieving and saving data")
 exit(0)